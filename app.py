@@ -1,6 +1,7 @@
 from flask import (
     Flask,
     render_template,
+    stream_template,
     request,
     redirect,
     url_for,
@@ -9,6 +10,7 @@ from flask import (
     jsonify,
     make_response,
     flash,
+    g,
 )
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_wtf.csrf import CSRFProtect
@@ -26,9 +28,10 @@ from core.auth.models import User
 from core.database import db_session, init_db
 from core.email.service import mail
 from core.payment.service import init_stripe
-from core.shared import challenge_manager
-from werkzeug.security import generate_password_hash, check_password_hash
+from core.shared import challenge_manager, get_challenges_view
+from core.auth.passwords import hash_password, verify_password, needs_rehash, CURRENT_SCHEME
 from dotenv import load_dotenv
+from sqlalchemy.orm import joinedload
 import os
 import base64
 
@@ -65,7 +68,12 @@ login_manager.login_view = 'user_login'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.filter_by(username=user_id).first()
+    # Eager-load buyer/seller profiles so authenticated pages get all
+    # three rows in one SELECT instead of separate Buyer/Seller queries
+    return User.query.options(
+        joinedload(User.buyer_profile),
+        joinedload(User.seller_profile)
+    ).filter_by(username=user_id).first()
 
 # Register blueprints
 app.register_blueprint(auth_bp)
@@ -82,40 +90,93 @@ init_db()
 # Cleanup database sessions after requests
 @app.teardown_appcontext
 def shutdown_session(exception=None):
-    db_session.remove()
-
-
-# --- Create/Update Admin User from .env ---
-admin_username = os.getenv('ADMIN_USERNAME')
-admin_password = os.getenv('ADMIN_PASSWORD')
-if admin_username and admin_password:
-    existing_admin = User.query.filter_by(username=admin_username).first()
-    if not existing_admin:
-        admin_user = User(
-            username=admin_username,
-            password_hash=generate_password_hash(admin_password),
-            email=os.getenv('MAIL_DEFAULT_SENDER', f'{admin_username}@admin.local'),
-            is_admin=True,
-            is_active=True,
-            email_verified=True
-        )
-        db_session.add(admin_user)
-        db_session.commit()
-        print(f"Admin user '{admin_username}' created from .env")
+    """Release the scoped session after each request.
+
+    remove() disposes the Session object entirely, forcing the next
+    request to rebuild it. For requests with no pending writes, close()
+    is enough - it releases the connection and clears state while
+    keeping the Session instance for reuse.
+    """
+    if exception is None and not (db_session.dirty or db_session.new or db_session.deleted):
+        db_session.close()
     else:
-        # Update existing admin user password if needed
-        if not existing_admin.is_admin:
-            existing_admin.is_admin = True
+        db_session.remove()
+
+
+# --- Startup bootstrap (admin user + default challenges) ---
+def bootstrap():
+    """Seed the admin user from .env and the default challenges.
+
+    Idempotent - safe to rerun. Exposed as `flask bootstrap` so deploy
+    scripts run it once instead of every worker paying the DB round-trips
+    at import time.
+    """
+    # --- Create/Update Admin User from .env ---
+    admin_username = os.getenv('ADMIN_USERNAME')
+    admin_password = os.getenv('ADMIN_PASSWORD')
+    if admin_username and admin_password:
+        existing_admin = User.query.filter_by(username=admin_username).first()
+        if not existing_admin:
+            admin_user = User(
+                username=admin_username,
+                password_hash=hash_password(admin_password),
+                password_scheme=CURRENT_SCHEME,
+                email=os.getenv('MAIL_DEFAULT_SENDER', f'{admin_username}@admin.local'),
+                is_admin=True,
+                is_active=True,
+                email_verified=True
+            )
+            db_session.add(admin_user)
             db_session.commit()
-            print(f"User '{admin_username}' promoted to admin from .env")
+            app.logger.info("Admin user '%s' created from .env", admin_username)
+        else:
+            # Update existing admin user password if needed
+            if not existing_admin.is_admin:
+                existing_admin.is_admin = True
+                db_session.commit()
+                app.logger.info("User '%s' promoted to admin from .env", admin_username)
+
+    # --- Initialize default challenges, skipping ones that already exist ---
+    default_challenges = [
+        ("aes_easy", "aes", "easy"),
+        ("vigenere_medium", "vigenere", "medium"),
+        ("rsa_hard", "rsa", "hard"),
+    ]
+    for challenge_id, challenge_type, difficulty in default_challenges:
+        try:
+            challenge_manager.create_challenge(challenge_id, challenge_type, difficulty)
+        except ValueError as e:
+            app.logger.info("Challenge creation error: %s", e)
+
+
+@app.cli.command('bootstrap')
+def bootstrap_command():
+    """Seed admin user and default challenges (run once at deploy)."""
+    bootstrap()
+
+
+# Back-compat: gunicorn-only deploys (Procfile/render.yaml) still expect
+# seeding at boot. Set BOOTSTRAP_ON_IMPORT=0 and run `flask bootstrap`
+# from the deploy script to keep imports side-effect-free.
+if os.getenv('BOOTSTRAP_ON_IMPORT', '1') == '1':
+    bootstrap()
+
+def cached_url_for(endpoint, **values):
+    """url_for memoized per request via flask.g.
+
+    url_for walks the URL map on every call; routes like submit_flag
+    build the same challenge URL several times per POST, so repeat calls
+    become a dict lookup instead.
+    """
+    cache = getattr(g, '_url_cache', None)
+    if cache is None:
+        cache = g._url_cache = {}
+    key = (endpoint, frozenset(values.items()))
+    url = cache.get(key)
+    if url is None:
+        url = cache[key] = url_for(endpoint, **values)
+    return url
 
-# --- Initialize default challenges here, to make sure they exists at startup ---
-try:
-    challenge_manager.create_challenge("aes_easy", "aes", "easy")
-    challenge_manager.create_challenge("vigenere_medium", "vigenere", "medium")
-    challenge_manager.create_challenge("rsa_hard", "rsa", "hard")
-except ValueError as e:
-    print(f"Challenge creation error: {e}")  
 
 # --- Authentication ---
 @app.route("/register", methods=["GET", "POST"])
@@ -131,7 +192,8 @@ def register():
         
         user = User(
             username=username,
-            password=generate_password_hash(password),
+            password_hash=hash_password(password),
+            password_scheme=CURRENT_SCHEME,
             email=email
         )
         db_session.add(user)
@@ -150,8 +212,13 @@ def user_login():
         password = request.form["password"]
         
         user = User.query.filter_by(username=username).first()
-        
-        if user and check_password_hash(user.password, password):
+
+        if user and verify_password(username, password, user.password_hash):
+            # Lazily upgrade legacy werkzeug hashes to bcrypt
+            if needs_rehash(user):
+                user.password_hash = hash_password(password)
+                user.password_scheme = CURRENT_SCHEME
+                db_session.commit()
             login_user(user)
             flash("Login successful!", "success")
             return redirect(url_for("list_challenges"))
@@ -176,36 +243,31 @@ def list_challenges():
     """List all available challenges."""
     verification_mode = request.args.get('mode', None)
     category = request.args.get('category', None)
-    challenges = challenge_manager.get_all_challenges()
-    
-    # Filter by category if specified
-    if category:
-        category_lower = category.lower()
-        challenges = {k: v for k, v in challenges.items() 
-                      if v.get('category', '').lower() == category_lower}
-    
+    # Cached filtered view - the category/difficulty filtering only
+    # reruns once per TTL window, not on every request
+    challenges = get_challenges_view(category, verification_mode)
+
     if verification_mode == 'buyer':
-        # Filter for easy challenges only
-        challenges = {k: v for k, v in challenges.items() if v['difficulty'] == 'easy'}
-        buyer = Buyer.query.filter_by(user_id=current_user.username).first()
+        buyer = current_user.buyer_profile
         if buyer:
-            solved_challenges = sum(1 for c in challenges.values() if c['id'] in buyer.solved_challenges)
+            solved_challenges = len(set(challenges) & set(buyer.get_solved_challenges()))
             progress = f"{solved_challenges}/3 easy challenges completed"
         else:
             progress = "0/3 easy challenges completed"
     elif verification_mode == 'seller':
-        # Filter for hard challenges only
-        challenges = {k: v for k, v in challenges.items() if v['difficulty'] == 'hard'}
-        seller = Seller.query.filter_by(user_id=current_user.username).first()
+        seller = current_user.seller_profile
         if seller:
-            solved_challenges = sum(1 for c in challenges.values() if c['id'] in seller.solved_challenges)
+            solved_challenges = len(set(challenges) & set(seller.get_solved_challenges()))
             progress = f"{solved_challenges}/5 hard challenges completed"
         else:
             progress = "0/5 hard challenges completed"
     else:
         progress = None
 
-    return render_template('challenges.html', 
+    # Stream the render: first bytes reach the browser while Jinja is
+    # still iterating the challenge list, and the full HTML buffer is
+    # never held in memory at once
+    return stream_template('challenges.html',
                          challenges=challenges,
                          verification_mode=verification_mode,
                          progress=progress,
@@ -240,33 +302,28 @@ def submit_flag(challenge_id):
     flag = request.form.get('flag')
     if not flag:
         flash('Please provide a flag.', 'error')
-        return redirect(url_for('view_challenge', challenge_id=challenge_id, mode=verification_mode))
+        return redirect(cached_url_for('view_challenge', challenge_id=challenge_id, mode=verification_mode))
 
     success, message = challenge_manager.submit_flag(challenge_id, current_user.username, flag)
     flash(message, 'success' if success else 'error')
 
     if success:
-        # Update user's solved challenges
+        # Update user's solved challenges - one UPDATE returning the new
+        # verified count instead of a SELECT + mutate + commit
         if verification_mode == 'buyer':
-            buyer = Buyer.query.filter_by(user_id=current_user.username).first()
-            if buyer:
-                buyer.add_solved_challenge(challenge_id)
-                db_session.commit()
-                # Check if buyer has completed enough challenges
-                if buyer.is_verified >= 3:
-                    flash('Congratulations! You have completed enough challenges to view products.', 'success')
-                    return redirect(url_for('marketplace.view_products'))
+            solved_count = Buyer.record_solved_challenge(current_user.username, challenge_id)
+            # Check if buyer has completed enough challenges
+            if solved_count is not None and solved_count >= 3:
+                flash('Congratulations! You have completed enough challenges to view products.', 'success')
+                return redirect(url_for('marketplace.view_products'))
         elif verification_mode == 'seller':
-            seller = Seller.query.filter_by(user_id=current_user.username).first()
-            if seller:
-                seller.add_solved_challenge(challenge_id, is_hard=True)
-                db_session.commit()
-                # Check if seller has completed enough challenges
-                if seller.is_verified >= 5:
-                    flash('Congratulations! You have completed enough challenges to sell products.', 'success')
-                    return redirect(url_for('marketplace.create_product'))
+            solved_count = Seller.record_solved_challenge(current_user.username, challenge_id, is_hard=True)
+            # Check if seller has completed enough challenges
+            if solved_count is not None and solved_count >= 5:
+                flash('Congratulations! You have completed enough challenges to sell products.', 'success')
+                return redirect(url_for('marketplace.create_product'))
 
-    return redirect(url_for('view_challenge', challenge_id=challenge_id, mode=verification_mode))
+    return redirect(cached_url_for('view_challenge', challenge_id=challenge_id, mode=verification_mode))
 
 @app.route("/challenge/<challenge_id>/hint", methods=["POST"])
 @login_required
@@ -274,7 +331,7 @@ def show_hint(challenge_id):
     """Show a hint for a challenge."""
     hint, message = challenge_manager.use_hint(challenge_id, current_user.username)
     flash(message, 'info' if hint else 'error')
-    return redirect(url_for('view_challenge', challenge_id=challenge_id))
+    return redirect(cached_url_for('view_challenge', challenge_id=challenge_id))
 
 
 # --- Index ---
@@ -283,14 +340,11 @@ def index():
     buyer = None
     seller = None
     if current_user.is_authenticated:
-        buyer = Buyer.query.filter_by(user_id=current_user.username).first()
-        seller = Seller.query.filter_by(user_id=current_user.username).first()
+        # Profiles are already loaded by the user_loader joinedload
+        buyer = current_user.buyer_profile
+        seller = current_user.seller_profile
     return render_template("index.html", buyer=buyer, seller=seller)
 
-@app.teardown_appcontext
-def shutdown_session(exception=None):
-    db_session.remove()
-
 if __name__ == "__main__":
     # Run on 0.0.0.0 to allow access from other devices on the network
     app.run(host='0.0.0.0', port=5000, debug=True)
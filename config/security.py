@@ -1,5 +1,6 @@
 from dotenv import load_dotenv
 import os
+import re
 import secrets
 
 # Load environment variables from a .env file
@@ -22,5 +23,11 @@ RSA_KEY_SIZE = int(os.environ.get("RSA_KEY_SIZE", 2048))
 # Hashing Algorithm
 HASH_ALGORITHM = os.environ.get("HASH_ALGORITHM", "sha256")
 
+# Password hashing cost (bcrypt rounds, 12-13 recommended)
+BCRYPT_COST = int(os.environ.get("BCRYPT_COST", 12))
+
 # Flag Format
-FLAG_FORMAT = "FLAG{.*}"  # Basic regex for flag
\ No newline at end of file
+FLAG_FORMAT = "FLAG{.*}"  # Basic regex for flag (kept for back-compat)
+# Precompiled once at import - anchored and escaped so flag checks reuse
+# the compiled pattern and can't backtrack on adversarial input
+FLAG_FORMAT_RE = re.compile(r'^FLAG\{.*\}$')
\ No newline at end of file
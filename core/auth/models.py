@@ -2,30 +2,40 @@ from core.database import Base
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, LargeBinary
 from sqlalchemy.orm import relationship
 from flask_login import UserMixin
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import secrets
 
+
+def utcnow():
+    """Timezone-aware replacement for the deprecated datetime.utcnow()."""
+    return datetime.now(timezone.utc)
+
+
 class User(Base, UserMixin):
     __tablename__ = 'users'
 
     id = Column(Integer, primary_key=True)
     username = Column(String(80), unique=True, nullable=False)
     password_hash = Column(String(255), nullable=False)  # Increased for scrypt hashes
+    password_scheme = Column(String(20), default='bcrypt')  # 'bcrypt' or legacy werkzeug
     email = Column(String(120), unique=True, nullable=True)
     email_verified = Column(Boolean, default=False)
     email_token = Column(String(100), unique=True)
     email_token_expiry = Column(DateTime)
     is_active = Column(Boolean, default=True)
     is_admin = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow)
     last_login = Column(DateTime)
     
-    # Password reset fields
-    reset_token = Column(String(100))
+    # Password reset fields (indexed - looked up by token on every
+    # reset-link click; email_token above gets its index from unique=True)
+    reset_token = Column(String(100), index=True)
     reset_token_expiry = Column(DateTime)
-    
-    # WebAuthn/Biometric login fields
-    webauthn_credential_id = Column(String(255), nullable=True)
+
+    # WebAuthn/Biometric login fields. The credential id is stored as raw
+    # bytes (BYTEA) - base64url round-trips per login cost two transforms
+    # and ~33% extra storage for no benefit server-side.
+    webauthn_credential_id = Column(LargeBinary, nullable=True, index=True)
     webauthn_public_key = Column(LargeBinary, nullable=True)
     webauthn_sign_count = Column(Integer, default=0)
 
@@ -38,8 +48,9 @@ class User(Base, UserMixin):
     
     def generate_email_token(self):
         """Generate a new email verification token"""
+        now = utcnow()  # one clock read for the whole operation
         self.email_token = secrets.token_urlsafe(32)
-        self.email_token_expiry = datetime.utcnow() + timedelta(hours=24)
+        self.email_token_expiry = now + timedelta(hours=24)
         return self.email_token
     
     def has_webauthn_credential(self):
@@ -0,0 +1,137 @@
+"""
+Password hashing helpers.
+
+Uses bcrypt with a configurable cost (BCRYPT_COST) instead of Werkzeug's
+generic pbkdf2 default, which is GPU-friendly and not tuned for KDF use.
+A small per-process LRU remembers recent *successful* verifications so a
+session refresh does not pay the full KDF cost on every login POST.
+Only a SHA-256 digest of the password is cached, never the plaintext.
+"""
+import hashlib
+import hmac
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from werkzeug.security import check_password_hash
+
+from config.security import BCRYPT_COST
+
+# Scheme stored on User.password_scheme; legacy werkzeug hashes are
+# anything else (pbkdf2/scrypt) and get rehashed lazily on login.
+CURRENT_SCHEME = "bcrypt"
+
+# Bounded pool for KDF verification. bcrypt's C core releases the GIL,
+# so running the ~250 ms verify here lets other requests' Python code
+# keep executing instead of stalling behind a login POST.
+_kdf_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 2,
+                               thread_name_prefix='kdf')
+
+# LRU of recently verified credentials:
+# (username, sha256(password)[:16], hash prefix) -> True
+_VERIFY_CACHE_MAX = 1024
+_verify_cache = OrderedDict()
+
+
+def hash_password(password):
+    """Hash a password with bcrypt at the configured cost."""
+    return bcrypt.hashpw(
+        password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_COST)
+    ).decode('ascii')
+
+
+def hash_password_async(password):
+    """Start hashing on the KDF pool, returning a Future.
+
+    Lets callers overlap the ~100 ms bcrypt work with their own DB
+    round-trips (bcrypt releases the GIL) and collect the hash with
+    .result() when they actually need it.
+    """
+    return _kdf_pool.submit(hash_password, password)
+
+
+# Parsed KDF parameters per stored legacy hash:
+# stored_hash -> (hash_name, iterations, salt bytes, expected hex digest),
+# or () when the format isn't plain pbkdf2 and we defer to werkzeug.
+# Legacy hashes shrink over time (lazy rehash), so a small cap suffices.
+_PARSED_HASH_MAX = 512
+_parsed_hash_cache = {}
+
+
+def _check_legacy(password, stored_hash):
+    """Verify a werkzeug-era hash, caching the parsed KDF parameters.
+
+    check_password_hash re-splits the method$salt$hash string and
+    re-dispatches on every call; after the first verification of a given
+    hash we go straight to hashlib.pbkdf2_hmac with the parsed parts.
+    """
+    parts = _parsed_hash_cache.get(stored_hash)
+    if parts is None:
+        parts = ()
+        try:
+            method, salt, digest = stored_hash.split('$', 2)
+            pieces = method.split(':')
+            if len(pieces) == 3 and pieces[0] == 'pbkdf2':
+                parts = (pieces[1], int(pieces[2]), salt.encode('ascii'), digest)
+        except ValueError:
+            pass
+        if len(_parsed_hash_cache) >= _PARSED_HASH_MAX:
+            _parsed_hash_cache.pop(next(iter(_parsed_hash_cache)))
+        _parsed_hash_cache[stored_hash] = parts
+
+    if parts:
+        hash_name, iterations, salt, digest = parts
+        computed = hashlib.pbkdf2_hmac(
+            hash_name, password.encode('utf-8'), salt, iterations
+        ).hex()
+        return hmac.compare_digest(computed, digest)
+
+    # Non-pbkdf2 legacy formats (e.g. scrypt): let werkzeug handle them
+    return check_password_hash(stored_hash, password)
+
+
+def _check(password, stored_hash):
+    """Verify against bcrypt or a legacy werkzeug hash."""
+    if stored_hash.startswith('$2'):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('ascii'))
+        except ValueError:
+            return False
+    # Legacy pbkdf2/scrypt hashes created by werkzeug
+    return _check_legacy(password, stored_hash)
+
+
+def verify_password(username, password, stored_hash):
+    """
+    Verify a password, consulting the per-process LRU first.
+
+    The cache key never contains the plaintext - only a truncated SHA-256
+    digest plus the stored hash prefix (so a password change invalidates
+    cached entries immediately).
+    """
+    if not stored_hash:
+        return False
+
+    pwd_digest = hashlib.sha256(password.encode('utf-8')).hexdigest()[:16]
+    cache_key = (username, pwd_digest, stored_hash[:32])
+
+    if cache_key in _verify_cache:
+        _verify_cache.move_to_end(cache_key)
+        return True
+
+    # Run the expensive KDF on the bounded pool; the request thread just
+    # blocks on the future while other requests proceed
+    if not _kdf_pool.submit(_check, password, stored_hash).result():
+        return False
+
+    # Only successful verifications are cached (no negative caching)
+    _verify_cache[cache_key] = True
+    if len(_verify_cache) > _VERIFY_CACHE_MAX:
+        _verify_cache.popitem(last=False)
+    return True
+
+
+def needs_rehash(user):
+    """True if the user's stored hash predates the current scheme."""
+    return user.password_scheme != CURRENT_SCHEME
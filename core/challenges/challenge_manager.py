@@ -24,6 +24,17 @@ import base64 # Often needed for encoding encrypted data
 import hashlib # Added for hash challenge
 import binascii # For error checking
 
+
+def extract_minigame_key(encrypted_msg):
+    """Pull the minigame key out of layered data (LAYER_TYPE:KEY:DATA)."""
+    if encrypted_msg and ':' in encrypted_msg:
+        parts = encrypted_msg.split(':', 2)
+        if len(parts) >= 2:
+            return parts[1]
+    # Fallback - use first 16 chars of encrypted message as "key"
+    return encrypted_msg[:16] if encrypted_msg else "UNKNOWNKEY123456"
+
+
 class ChallengeManager:
     def __init__(self):
         self.generator = ChallengeGenerator()
@@ -161,11 +172,17 @@ class ChallengeManager:
         # --- Create database record ---
         db_hints = json.dumps(hints or challenge_details.get('hints', []))
         db_files = json.dumps(processed_files)
+        # Split the minigame key once here; the routes read the stored
+        # parts instead of re-deriving them on every game page
+        from core.challenges.minigames import key_reveal_manager
+        minigame_key = extract_minigame_key(layered_encrypted_data_str)
+        key_parts = key_reveal_manager.split_key(minigame_key) if minigame_key else []
         db_challenge = Challenge(id=challenge_id, type=challenge_type, difficulty=difficulty,
                                  description=description or challenge_details.get('description', ''),
                                  points=int(points), hints=db_hints,
                                  encrypted_message=layered_encrypted_data_str, flag=flag,
-                                 is_active=True, files=db_files)
+                                 is_active=True, files=db_files,
+                                 key_parts_json=key_parts)
         db_session.add(db_challenge)
         db_session.commit()
 
@@ -1,68 +1,95 @@
 """
 Minigames module for revealing encryption keys through interactive games.
 """
+import atexit
+import itertools
+import logging
 import random
 import string
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from core.challenges.models import MinigameProgress
+from core.database import db_session
 
-# Quiz question bank for crypto/security topics
-QUIZ_QUESTIONS = [
+log = logging.getLogger(__name__)
+
+# Completion persistence runs off the request thread so the JSON
+# response doesn't wait on the INSERT+commit. The insert is idempotent
+# (ON CONFLICT DO NOTHING), so a retry or duplicate submit is harmless.
+_PERSIST_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='minigame-db')
+atexit.register(_PERSIST_EXECUTOR.shutdown, wait=True)
+
+# Per-(user, challenge) progress cache. Each minigame view re-reads
+# progress just to test one game_type, so a short TTL plus write-through
+# invalidation in mark_game_completed collapses those reads to one DB
+# query per user per challenge per TTL window.
+_PROGRESS_TTL = 300.0
+_PROGRESS_CACHE_MAX = 4096
+_progress_cache = {}  # (user_id, challenge_id) -> (progress dict, monotonic deadline)
+_progress_lock = threading.Lock()
+
+# Quiz question bank for crypto/security topics.
+# Read-only: frozen as a tuple with tuple options so the bank is built
+# once per process and never mutated by request handlers. (Questions stay
+# plain dicts because they get serialized into the Flask session.)
+QUIZ_QUESTIONS = (
     {
         "question": "What does AES stand for?",
-        "options": ["Advanced Encryption Standard", "Automatic Encryption System", "Applied Electronic Security", "Abstract Encoding Scheme"],
+        "options": ("Advanced Encryption Standard", "Automatic Encryption System", "Applied Electronic Security", "Abstract Encoding Scheme"),
         "answer": 0
     },
     {
         "question": "Which encryption is asymmetric?",
-        "options": ["AES", "DES", "RSA", "XOR"],
+        "options": ("AES", "DES", "RSA", "XOR"),
         "answer": 2
     },
     {
         "question": "What is the purpose of an IV in encryption?",
-        "options": ["Speed up encryption", "Add randomness", "Compress data", "Verify integrity"],
+        "options": ("Speed up encryption", "Add randomness", "Compress data", "Verify integrity"),
         "answer": 1
     },
     {
         "question": "Which hash function is considered insecure?",
-        "options": ["SHA-256", "SHA-512", "MD5", "SHA-3"],
+        "options": ("SHA-256", "SHA-512", "MD5", "SHA-3"),
         "answer": 2
     },
     {
         "question": "What does XOR mean?",
-        "options": ["Extra Operational Register", "Exclusive OR", "Extended Output Result", "External Operation Request"],
+        "options": ("Extra Operational Register", "Exclusive OR", "Extended Output Result", "External Operation Request"),
         "answer": 1
     },
     {
         "question": "What key size does AES-256 use?",
-        "options": ["128 bits", "192 bits", "256 bits", "512 bits"],
+        "options": ("128 bits", "192 bits", "256 bits", "512 bits"),
         "answer": 2
     },
     {
         "question": "What is a Caesar cipher?",
-        "options": ["Substitution cipher", "Block cipher", "Stream cipher", "Hash function"],
+        "options": ("Substitution cipher", "Block cipher", "Stream cipher", "Hash function"),
         "answer": 0
     },
     {
         "question": "What does SSL stand for?",
-        "options": ["Secure Sockets Layer", "System Security Lock", "Safe Socket Link", "Secure System Login"],
+        "options": ("Secure Sockets Layer", "System Security Lock", "Safe Socket Link", "Secure System Login"),
         "answer": 0
     },
     {
         "question": "What is a rainbow table used for?",
-        "options": ["Color encryption", "Password cracking", "Data compression", "Network routing"],
+        "options": ("Color encryption", "Password cracking", "Data compression", "Network routing"),
         "answer": 1
     },
     {
         "question": "What is the purpose of salt in hashing?",
-        "options": ["Speed up hashing", "Prevent rainbow table attacks", "Compress data", "Encrypt the hash"],
+        "options": ("Speed up hashing", "Prevent rainbow table attacks", "Compress data", "Encrypt the hash"),
         "answer": 1
     }
-]
+)
 
-# Word scramble terms
-SCRAMBLE_WORDS = [
+# Word scramble terms (read-only, frozen)
+SCRAMBLE_WORDS = (
     ("ENCRYPTION", "Process of encoding data"),
     ("DECRYPTION", "Process of decoding data"),
     ("ALGORITHM", "Set of rules for calculations"),
@@ -73,7 +100,7 @@ SCRAMBLE_WORDS = [
     ("HASHING", "One-way function"),
     ("SECURITY", "Protection from threats"),
     ("CRYPTOGRAPHY", "Science of secret writing")
-]
+)
 
 
 class KeyRevealManager:
@@ -93,45 +120,93 @@ class KeyRevealManager:
         # Ensure key is string
         key = str(key)
         
-        # Calculate part sizes
+        # Calculate part sizes, then precompute slice offsets so the hot
+        # loop body is a single slice + dict literal (no per-iteration math)
         key_length = len(key)
         base_size = key_length // num_parts
         remainder = key_length % num_parts
-        
-        parts = []
-        start = 0
-        
-        for i in range(num_parts):
-            # Add 1 to size for first 'remainder' parts
-            size = base_size + (1 if i < remainder else 0)
-            if size > 0:
-                parts.append({
-                    'index': i,
-                    'value': key[start:start + size],
-                    'game_type': self.minigame_types[i % len(self.minigame_types)],
-                    'revealed': False
-                })
-                start += size
-        
-        return parts
+
+        sizes = [base_size + (1 if i < remainder else 0) for i in range(num_parts)]
+        offsets = list(itertools.accumulate([0] + sizes))
+        num_types = len(self.minigame_types)
+
+        return [
+            {
+                'index': i,
+                'value': key[offsets[i]:offsets[i + 1]],
+                'game_type': self.minigame_types[i % num_types],
+                'revealed': False
+            }
+            for i, size in enumerate(sizes) if size > 0
+        ]
     
     def get_user_progress(self, user_id: int, challenge_id: str) -> dict:
-        """Get user's minigame progress for a challenge from database."""
-        progress_records = MinigameProgress.get_user_progress(user_id, challenge_id)
-        
+        """Get user's minigame progress for a challenge, cached briefly.
+
+        mark_game_completed patches the cached entry in place
+        (write-through), so a completion is visible on the very next
+        read in this process.
+        """
+        cache_key = (user_id, challenge_id)
+        now = time.monotonic()
+        with _progress_lock:
+            entry = _progress_cache.get(cache_key)
+        if entry and entry[1] > now:
+            return entry[0]
+
+        progress = self.get_progress_for_challenges(user_id, [challenge_id])[challenge_id]
+        with _progress_lock:
+            if len(_progress_cache) >= _PROGRESS_CACHE_MAX:
+                _progress_cache.pop(next(iter(_progress_cache)))
+            _progress_cache[cache_key] = (progress, now + _PROGRESS_TTL)
+        return progress
+
+    def get_progress_for_challenges(self, user_id: int, challenge_ids: list) -> dict:
+        """Batch-load minigame progress for several challenges in one query."""
+        by_challenge = MinigameProgress.get_user_progress(user_id, challenge_ids)
+
         result = {}
-        for record in progress_records:
-            result[record.minigame_type] = {
-                'completed': True,
-                'revealed_part': record.revealed_part,
-                'completed_at': record.completed_at.isoformat() if record.completed_at else None
+        for challenge_id, records in by_challenge.items():
+            result[challenge_id] = {
+                minigame_type: {
+                    'completed': True,
+                    'revealed_part': record.revealed_part,
+                    'completed_at': record.completed_at.isoformat() if record.completed_at else None
+                }
+                for minigame_type, record in records.items()
             }
         return result
-    
+
     def mark_game_completed(self, user_id: int, challenge_id: str, game_type: str, revealed_part: str, part_index: int = 0):
-        """Mark a minigame as completed and store the revealed part in database."""
-        # Check if already completed to avoid duplicates
-        if not MinigameProgress.has_completed(user_id, challenge_id, game_type):
+        """Mark a minigame as completed and store the revealed part in database.
+
+        The DB write happens on a background thread so the handler can
+        answer immediately; the progress cache is patched synchronously
+        so the hub redirect already shows the win.
+        """
+        cache_key = (user_id, challenge_id)
+        completed = {
+            'completed': True,
+            'revealed_part': revealed_part,
+            'completed_at': datetime.utcnow().isoformat(),
+        }
+        with _progress_lock:
+            entry = _progress_cache.get(cache_key)
+            if entry:
+                # Replace rather than mutate - readers may hold the old dict
+                progress = dict(entry[0])
+                progress[game_type] = completed
+                _progress_cache[cache_key] = (progress, entry[1])
+
+        _PERSIST_EXECUTOR.submit(
+            self._persist_completion,
+            user_id, challenge_id, game_type, part_index, revealed_part,
+        )
+
+    @staticmethod
+    def _persist_completion(user_id, challenge_id, game_type, part_index, revealed_part):
+        try:
+            # Insert is idempotent (ON CONFLICT DO NOTHING), no pre-check needed
             MinigameProgress.mark_completed(
                 user_id=user_id,
                 challenge_id=challenge_id,
@@ -139,23 +214,27 @@ class KeyRevealManager:
                 part_index=part_index,
                 revealed_part=revealed_part
             )
+        except Exception:
+            log.exception("Failed to persist minigame completion (user=%s challenge=%s game=%s)",
+                          user_id, challenge_id, game_type)
+        finally:
+            # Worker threads own their scoped session - return it to the pool
+            db_session.remove()
     
     def get_revealed_key(self, user_id: int, challenge_id: str, key_parts: list) -> str:
         """
         Get the full revealed key based on completed minigames.
         Returns masked string with * for unrevealed parts.
         """
+        # Single DB query (get_user_progress), then one join - avoids the
+        # O(n^2) intermediate strings that += concatenation would create
         progress = self.get_user_progress(user_id, challenge_id)
-        result = ""
-        
-        for part in key_parts:
-            game_type = part['game_type']
-            if game_type in progress and progress[game_type].get('completed'):
-                result += part['value']
-            else:
-                result += '*' * len(part['value'])
-        
-        return result
+        return ''.join(
+            part['value']
+            if progress.get(part['game_type'], {}).get('completed')
+            else '*' * len(part['value'])
+            for part in key_parts
+        )
     
     # --- Wheel Spin Game ---
     def generate_wheel_segments(self, key_part: str) -> list:
@@ -170,23 +249,28 @@ class KeyRevealManager:
         # Add correct characters
         for char in correct_chars:
             segments.append({'char': char.upper(), 'is_correct': True})
-        
-        # Add decoy characters
-        for _ in range(decoy_count):
-            decoy = random.choice(all_chars)
+
+        # Add decoy characters - one batched draw instead of a choice() per decoy
+        for decoy in random.choices(all_chars, k=decoy_count):
             segments.append({'char': decoy, 'is_correct': False})
-        
+
         random.shuffle(segments)
         return segments
     
     # --- Quiz Game ---
+    def get_quiz_question_indices(self, count: int = 3) -> list:
+        """Sample question indices into the frozen bank."""
+        return random.sample(range(len(QUIZ_QUESTIONS)), min(count, len(QUIZ_QUESTIONS)))
+
+    def quiz_questions_for(self, indices: list) -> list:
+        """Resolve bank indices back to question dicts."""
+        return [QUIZ_QUESTIONS[i] for i in indices if 0 <= i < len(QUIZ_QUESTIONS)]
+
     def get_quiz_questions(self, count: int = 3) -> list:
         """Get random quiz questions."""
-        selected = random.sample(QUIZ_QUESTIONS, min(count, len(QUIZ_QUESTIONS)))
-        # Shuffle options for each question
-        for q in selected:
-            q = q.copy()
-        return selected
+        # Sample small ints instead of dict references, then index into
+        # the frozen bank - cheaper than sampling the objects themselves
+        return self.quiz_questions_for(self.get_quiz_question_indices(count))
     
     def verify_quiz_answers(self, questions: list, answers: list) -> tuple:
         """Verify quiz answers. Returns (correct_count, total)."""
@@ -223,19 +307,25 @@ class KeyRevealManager:
         # Create a solvable puzzle state
         solution = list(range(1, 9)) + [0]  # 1-8 and empty (0)
         
-        # Shuffle to create puzzle (ensure solvable)
+        # Shuffle to create puzzle (ensure solvable). The empty-tile index
+        # is tracked locally (no puzzle.index(0) scan per step) and the 100
+        # random draws are batched up front. The modulo map is slightly
+        # biased when only 2-3 moves are legal, which is irrelevant for
+        # scrambling.
         puzzle = solution.copy()
-        for _ in range(100):
-            empty_idx = puzzle.index(0)
+        empty_idx = puzzle.index(0)
+        draws = random.choices(range(4), k=100)
+        for draw in draws:
             # Find valid moves
             moves = []
             if empty_idx >= 3: moves.append(empty_idx - 3)  # Up
             if empty_idx < 6: moves.append(empty_idx + 3)   # Down
             if empty_idx % 3 > 0: moves.append(empty_idx - 1)  # Left
             if empty_idx % 3 < 2: moves.append(empty_idx + 1)  # Right
-            
-            swap_idx = random.choice(moves)
+
+            swap_idx = moves[draw % len(moves)]
             puzzle[empty_idx], puzzle[swap_idx] = puzzle[swap_idx], puzzle[empty_idx]
+            empty_idx = swap_idx
         
         return {
             'puzzle': puzzle,
@@ -253,12 +343,13 @@ class KeyRevealManager:
         """Generate a word scramble puzzle."""
         word, hint = random.choice(SCRAMBLE_WORDS)
         scrambled = list(word)
-        random.shuffle(scrambled)
-        
-        # Make sure it's actually scrambled
-        while ''.join(scrambled) == word:
-            random.shuffle(scrambled)
-        
+
+        # Sattolo's shuffle: one O(n) pass that guarantees a cyclic
+        # permutation, so no retry loop is needed to avoid the original word
+        for i in range(len(scrambled) - 1, 0, -1):
+            j = random.randrange(i)
+            scrambled[i], scrambled[j] = scrambled[j], scrambled[i]
+
         return {
             'scrambled': ''.join(scrambled),
             'word': word,
@@ -1,12 +1,24 @@
-from core.database import Base, db_session
-from sqlalchemy import Column, Integer, String, Boolean, JSON, Text, DateTime, ForeignKey
+from core.database import Base, db_session, engine
+from sqlalchemy import Column, Integer, String, Boolean, JSON, Text, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
+if engine.dialect.name == 'postgresql':
+    from sqlalchemy.dialects.postgresql import insert as dialect_insert
+else:
+    from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
 
 class MinigameProgress(Base):
     """Track user progress in challenge minigames."""
     __tablename__ = 'minigame_progress'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'challenge_id', 'minigame_type',
+                         name='uq_minigame_progress_user_challenge_type'),
+        # Backs the hot (user_id, challenge_id) filters in
+        # get_user_progress/has_completed - index seek instead of a scan
+        Index('ix_mgp_user_chal', 'user_id', 'challenge_id'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -20,13 +32,29 @@ class MinigameProgress(Base):
         return f"<MinigameProgress(user_id={self.user_id}, challenge_id='{self.challenge_id}', type='{self.minigame_type}')>"
 
     @classmethod
-    def get_user_progress(cls, user_id, challenge_id):
-        """Get all completed minigames for a user on a challenge."""
-        return db_session.query(cls).filter_by(
-            user_id=user_id,
-            challenge_id=challenge_id
+    def get_user_progress(cls, user_id, challenge_ids):
+        """
+        Batch-load completed minigames for a user across challenges.
+
+        Accepts a single challenge_id or a list of them; issues one IN
+        query and returns {challenge_id: {minigame_type: row}} so pages
+        rendering multiple challenges incur 1 SELECT, not N.
+        """
+        if isinstance(challenge_ids, str):
+            challenge_ids = [challenge_ids]
+        if not challenge_ids:
+            return {}
+
+        records = db_session.query(cls).filter(
+            cls.user_id == user_id,
+            cls.challenge_id.in_(challenge_ids)
         ).all()
 
+        result = {challenge_id: {} for challenge_id in challenge_ids}
+        for record in records:
+            result[record.challenge_id][record.minigame_type] = record
+        return result
+
     @classmethod
     def has_completed(cls, user_id, challenge_id, minigame_type):
         """Check if user has completed a specific minigame for a challenge."""
@@ -38,20 +66,33 @@ class MinigameProgress(Base):
 
     @classmethod
     def mark_completed(cls, user_id, challenge_id, minigame_type, part_index, revealed_part):
-        """Mark a minigame as completed and store the revealed key part."""
-        progress = cls(
+        """
+        Mark a minigame as completed and store the revealed key part.
+
+        Uses INSERT ... ON CONFLICT DO NOTHING against the unique
+        (user_id, challenge_id, minigame_type) constraint, so callers do
+        not need a SELECT pre-check (and there is no SELECT-then-INSERT
+        race on double submits).
+        """
+        stmt = dialect_insert(cls.__table__).values(
             user_id=user_id,
             challenge_id=challenge_id,
             minigame_type=minigame_type,
             part_index=part_index,
-            revealed_part=revealed_part
+            revealed_part=revealed_part,
+            completed_at=datetime.utcnow()
+        ).on_conflict_do_nothing(
+            index_elements=['user_id', 'challenge_id', 'minigame_type']
         )
-        db_session.add(progress)
+        db_session.execute(stmt)
         db_session.commit()
-        return progress
 
 class Challenge(Base):
     __tablename__ = 'challenges'
+    __table_args__ = (
+        # list_challenges and the verification pages filter by difficulty
+        Index('ix_chal_difficulty', 'difficulty'),
+    )
 
     id = Column(String(50), primary_key=True)
     type = Column(String(20), nullable=False)
@@ -63,6 +104,10 @@ class Challenge(Base):
     flag = Column(String(100), nullable=False)
     is_active = Column(Boolean, default=True)
     files = Column(JSON, nullable=True)
+    # Minigame key parts, computed once at creation (the key never
+    # changes after that - update_challenge refuses encrypted_message
+    # edits), so game routes read a column instead of re-splitting
+    key_parts_json = Column(JSON, nullable=True)
 
     def to_dict(self , exclude_flag = False):
         """Convert challenge to dictionary format."""
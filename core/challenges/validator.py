@@ -4,6 +4,7 @@ from typing import Dict, Any, Union
 # Assuming Challenge model is imported where needed
 from core.challenges.models import Challenge
 from core.crypto.ciphers import HashFunction # Only HashFunction seems used here
+from config.security import FLAG_FORMAT_RE # Precompiled at import time
 
 class ChallengeValidator:
     @staticmethod
@@ -43,6 +44,13 @@ class ChallengeValidator:
              print(f"[Validator Debug] Challenge object (ID: {challenge.id}) has no expected flag stored.")
              return False # Cannot validate if the expected flag is missing
 
+        # --- Cheap format short-circuit (uses the precompiled pattern) ---
+        # Only applies when the stored flag follows the FLAG{...} convention,
+        # so challenges with custom-format flags are unaffected.
+        if FLAG_FORMAT_RE.match(expected_flag.strip()) and not FLAG_FORMAT_RE.match(submitted_flag.strip()):
+            print("[Validator Debug] Submitted flag does not match expected FLAG{...} format.")
+            return False
+
         # --- Simple comparison (Default) ---
         # Consider trimming whitespace and case-insensitivity based on requirements
         is_correct = (submitted_flag.strip() == expected_flag.strip())
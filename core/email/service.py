@@ -1,11 +1,61 @@
+import atexit
+import logging
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from flask import current_app, url_for
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 import os
 
+log = logging.getLogger(__name__)
+
 # Brevo API configuration
 BREVO_API_URL = "https://api.brevo.com/v3/smtp/email"
 
+# Pooled session shared by all sends - keeps the TLS connection to Brevo
+# warm instead of handshaking on every email
+_BREVO_SESSION = requests.Session()
+_BREVO_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3,
+                      status_forcelist=[502, 503, 504]),
+))
+
+# Bounded worker pool for outgoing mail. A Thread per email created
+# unbounded OS threads under registration bursts and dropped in-flight
+# mail on shutdown; the executor reuses warm threads (and the pooled
+# session's TLS connections) and drains at exit.
+_EMAIL_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv('EMAIL_WORKERS', '8')),
+    thread_name_prefix='brevo'
+)
+atexit.register(_EMAIL_EXECUTOR.shutdown, wait=True)
+
+# Environment-derived config read once at import. os.getenv plus dict
+# construction on every send is wasted work - the values only change on
+# deploy. reload_config() re-reads them for tests or live key rotation.
+_API_KEY = None
+_HEADERS = None
+_SENDER = None
+
+
+def reload_config():
+    """Re-read Brevo settings from the environment."""
+    global _API_KEY, _HEADERS, _SENDER
+    _API_KEY = os.getenv('BREVO_API_KEY')
+    _HEADERS = {
+        'accept': 'application/json',
+        'api-key': _API_KEY,
+        'content-type': 'application/json'
+    }
+    _SENDER = {
+        'name': os.getenv('BREVO_SENDER_NAME', 'Momento'),
+        'email': os.getenv('BREVO_SENDER_EMAIL', 'noreply@momento.com')
+    }
+
+
+reload_config()
+
 # Dummy Mail class for compatibility (Flask-Mail replacement)
 class BrevoMail:
     def __init__(self, app=None):
@@ -16,51 +66,76 @@ class BrevoMail:
 
 mail = BrevoMail()
 
+# Verification email body built once at import; only the URL is
+# interpolated per send instead of re-parsing the whole f-string
+_VERIFY_HTML_TMPL = '''
+    <h1>Welcome to Momento!</h1>
+    <p>Thank you for registering. To verify your email address, please click the link below:</p>
+    <p><a href="{url}" style="background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">Verify Email</a></p>
+    <p>Or copy and paste this link into your browser:</p>
+    <p>{url}</p>
+    <p>This link will expire in 24 hours.</p>
+    <p>If you did not register for Momento, please ignore this email.</p>
+    '''
+
 
 def send_async_email(app, email_data):
     """Send email asynchronously using Brevo API"""
     with app.app_context():
-        api_key = os.getenv('BREVO_API_KEY')
-        
-        if not api_key:
-            print("Warning: BREVO_API_KEY not configured")
+        if not _API_KEY:
+            log.warning("BREVO_API_KEY not configured")
             return False
-            
-        headers = {
-            'accept': 'application/json',
-            'api-key': api_key,
-            'content-type': 'application/json'
-        }
-        
+
         try:
-            response = requests.post(BREVO_API_URL, json=email_data, headers=headers)
+            response = _BREVO_SESSION.post(BREVO_API_URL, json=email_data, headers=_HEADERS)
             if response.status_code == 201:
-                print(f"Email sent successfully to {email_data['to'][0]['email']}")
+                log.info("Email sent successfully to %s", email_data['to'][0]['email'])
                 return True
             else:
-                print(f"Failed to send email: {response.status_code} - {response.text}")
+                log.error("Failed to send email: %s - %s", response.status_code, response.text)
                 return False
-        except Exception as e:
-            print(f"Error sending email: {e}")
+        except Exception:
+            log.exception("Error sending email")
             return False
 
 
 def send_email(subject, recipients, html_body):
     """Send email asynchronously using Brevo API"""
-    sender_email = os.getenv('BREVO_SENDER_EMAIL', 'noreply@momento.com')
-    sender_name = os.getenv('BREVO_SENDER_NAME', 'Momento')
-    
     email_data = {
-        'sender': {
-            'name': sender_name,
-            'email': sender_email
-        },
+        'sender': _SENDER,
         'to': [{'email': recipient} for recipient in recipients],
         'subject': subject,
         'htmlContent': html_body
     }
     
-    Thread(target=send_async_email, args=(current_app._get_current_object(), email_data)).start()
+    _EMAIL_EXECUTOR.submit(send_async_email, current_app._get_current_object(), email_data)
+
+
+def send_bulk_email(subject, per_recipient_html):
+    """Send one email per recipient in a single batched Brevo call.
+
+    per_recipient_html maps recipient address -> HTML body. Brevo's
+    messageVersions lets one POST carry per-recipient variations, so a
+    fan-out (announcements, batched verification resends) costs one TLS
+    round-trip instead of one per recipient.
+    """
+    if not per_recipient_html:
+        return
+
+    email_data = {
+        'sender': _SENDER,
+        'subject': subject,
+        # Top-level to/htmlContent are required by the API; versions
+        # below override them per recipient
+        'to': [{'email': next(iter(per_recipient_html))}],
+        'htmlContent': next(iter(per_recipient_html.values())),
+        'messageVersions': [
+            {'to': [{'email': recipient}], 'htmlContent': html}
+            for recipient, html in per_recipient_html.items()
+        ]
+    }
+
+    _EMAIL_EXECUTOR.submit(send_async_email, current_app._get_current_object(), email_data)
 
 
 def send_verification_email(user):
@@ -73,17 +148,9 @@ def send_verification_email(user):
         raise ValueError("User does not have an email verification token. Generate one first.")
     
     verify_url = url_for('auth.verify_email', token=user.email_token, _external=True)
-    
-    html = f'''
-    <h1>Welcome to Momento!</h1>
-    <p>Thank you for registering. To verify your email address, please click the link below:</p>
-    <p><a href="{verify_url}" style="background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">Verify Email</a></p>
-    <p>Or copy and paste this link into your browser:</p>
-    <p>{verify_url}</p>
-    <p>This link will expire in 24 hours.</p>
-    <p>If you did not register for Momento, please ignore this email.</p>
-    '''
-    
+
+    html = _VERIFY_HTML_TMPL.format(url=verify_url)
+
     send_email(
         'Verify Your Email - Momento',
         [user.email],
@@ -9,9 +9,10 @@ from sqlalchemy import (
     Boolean,
     Text,               # ← Use Text instead of JSON for full SQLite compatibility
     text,
+    Index,
 )
 from sqlalchemy.orm import relationship
-from core.database import Base
+from core.database import Base, db_session, engine
 from core.auth.models import User
 import enum
 from datetime import datetime
@@ -81,6 +82,39 @@ class Buyer(Base):
             self.solved_challenges = json.dumps(solved)
             self.is_verified = len(solved)
 
+    @classmethod
+    def record_solved_challenge(cls, user_id, challenge_id):
+        """Append a solved challenge and return the new verified count.
+
+        On Postgres this is a single UPDATE ... RETURNING (one round-trip,
+        no read-modify-write race between concurrent submissions). SQLite
+        falls back to the ORM path. Returns None if no buyer row exists.
+        """
+        if engine.dialect.name == 'postgresql':
+            from sqlalchemy import text as sql_text
+            row = db_session.execute(sql_text("""
+                UPDATE buyers SET
+                    solved_challenges = CASE
+                        WHEN jsonb_exists(solved_challenges::jsonb, :c) THEN solved_challenges
+                        ELSE (solved_challenges::jsonb || to_jsonb(CAST(:c AS text)))::text
+                    END,
+                    is_verified = jsonb_array_length(CASE
+                        WHEN jsonb_exists(solved_challenges::jsonb, :c) THEN solved_challenges::jsonb
+                        ELSE solved_challenges::jsonb || to_jsonb(CAST(:c AS text))
+                    END)
+                WHERE user_id = :u
+                RETURNING is_verified
+            """), {'c': challenge_id, 'u': user_id}).first()
+            db_session.commit()
+            return row[0] if row else None
+
+        buyer = db_session.query(cls).filter_by(user_id=user_id).first()
+        if not buyer:
+            return None
+        buyer.add_solved_challenge(challenge_id)
+        db_session.commit()
+        return buyer.is_verified
+
 
 # ------------------- Seller -------------------
 class Seller(Base):
@@ -122,6 +156,42 @@ class Seller(Base):
             if is_hard:
                 self.hard_challenges_completed += 1
 
+    @classmethod
+    def record_solved_challenge(cls, user_id, challenge_id, is_hard=False):
+        """Append a solved challenge and return the new verified count.
+
+        Single UPDATE ... RETURNING on Postgres (see Buyer); ORM fallback
+        on SQLite. Returns None if no seller row exists.
+        """
+        if engine.dialect.name == 'postgresql':
+            from sqlalchemy import text as sql_text
+            row = db_session.execute(sql_text("""
+                UPDATE sellers SET
+                    hard_challenges_completed = hard_challenges_completed + CASE
+                        WHEN :is_hard AND NOT jsonb_exists(solved_challenges::jsonb, :c) THEN 1
+                        ELSE 0
+                    END,
+                    solved_challenges = CASE
+                        WHEN jsonb_exists(solved_challenges::jsonb, :c) THEN solved_challenges
+                        ELSE (solved_challenges::jsonb || to_jsonb(CAST(:c AS text)))::text
+                    END,
+                    is_verified = jsonb_array_length(CASE
+                        WHEN jsonb_exists(solved_challenges::jsonb, :c) THEN solved_challenges::jsonb
+                        ELSE solved_challenges::jsonb || to_jsonb(CAST(:c AS text))
+                    END)
+                WHERE user_id = :u
+                RETURNING is_verified
+            """), {'c': challenge_id, 'u': user_id, 'is_hard': is_hard}).first()
+            db_session.commit()
+            return row[0] if row else None
+
+        seller = db_session.query(cls).filter_by(user_id=user_id).first()
+        if not seller:
+            return None
+        seller.add_solved_challenge(challenge_id, is_hard=is_hard)
+        db_session.commit()
+        return seller.is_verified
+
 
 # ------------------- Product -------------------
 class Product(Base):
@@ -141,6 +211,17 @@ class Product(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True, nullable=False, server_default=text('true'))
 
+    # Listing pages filter is_active and sort by created_at DESC on every
+    # hit; the partial index serves that as an index-only scan on Postgres
+    # (SQLite ignores the WHERE clause and builds a plain index). The
+    # seller_id index backs seller_products and the selectin loads.
+    # Buyer.user_id / Seller.user_id already have indexes via unique=True.
+    __table_args__ = (
+        Index('ix_product_seller_id', 'seller_id'),
+        Index('ix_product_active_created', created_at.desc(),
+              postgresql_where=text('is_active = true')),
+    )
+
     # Relationships
     seller = relationship("Seller", back_populates="products")
     payments = relationship("Payment", back_populates="product")
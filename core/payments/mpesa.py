@@ -3,10 +3,25 @@ M-Pesa Daraja API Integration
 Safaricom M-Pesa STK Push (Lipa Na M-Pesa Online)
 """
 import os
-import base64
+import time
+import logging
+import threading
 import requests
+from binascii import b2a_base64
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter, Retry
 from datetime import datetime
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
+
+log = logging.getLogger(__name__)
+
+# Deletes spaces, dashes and '+' in a single C-level pass - replaces the
+# chain of str.replace calls that each allocated an intermediate string
+_PHONE_STRIP = str.maketrans('', '', ' -+')
+
+# Daraja has no batch status endpoint, so batched queries fan out over
+# this pool; the pooled session below keeps them on warm connections.
+_QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='mpesa-query')
 
 
 class MpesaClient:
@@ -36,7 +51,33 @@ class MpesaClient:
         
         self.base_url = self.PRODUCTION_BASE_URL if self.env == 'production' else self.SANDBOX_BASE_URL
         self._access_token = None
-        self._token_expiry = None
+        # Monotonic deadline - one CLOCK_MONOTONIC read + float compare
+        # per validity check, immune to wall-clock jumps
+        self._token_expiry_mono = 0.0
+        self._token_lock = threading.Lock()
+
+        # Shortcode+passkey never change after init, so the password
+        # prefix is encoded once here; _generate_password only appends
+        # the timestamp bytes per call
+        self._pw_prefix = f"{self.shortcode}{self.passkey}".encode('ascii')
+
+        # Pooled session so OAuth + STK push reuse the same TLS connection
+        # to Daraja instead of paying a fresh handshake per call. Retries
+        # back off inside urllib3 (no Python sleep loops) and honour
+        # Daraja's Retry-After on 429s; POST is safe to retry here since
+        # both OAuth and STK/query requests are idempotent on their side.
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(
+                total=3, connect=3, read=2,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods={'GET', 'POST'},
+                respect_retry_after_header=True,
+            ),
+        ))
     
     def _get_base_url(self) -> str:
         """Get API base URL based on environment."""
@@ -45,40 +86,49 @@ class MpesaClient:
     def get_access_token(self) -> Optional[str]:
         """
         Get OAuth access token from Daraja API.
-        Token is cached and reused until expiry.
+        Token is cached and reused until expiry; refresh is serialized so
+        concurrent requests don't stampede the OAuth endpoint.
         """
-        # Return cached token if still valid
-        if self._access_token and self._token_expiry:
-            if datetime.now() < self._token_expiry:
-                return self._access_token
-        
-        try:
-            url = f"{self._get_base_url()}/oauth/v1/generate?grant_type=client_credentials"
-            
-            # Create Basic Auth header
-            credentials = f"{self.consumer_key}:{self.consumer_secret}"
-            encoded_credentials = base64.b64encode(credentials.encode()).decode()
-            
-            headers = {
-                "Authorization": f"Basic {encoded_credentials}",
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            self._access_token = data.get('access_token')
-            
-            # Token typically expires in 3600 seconds, cache for 50 minutes
-            from datetime import timedelta
-            self._token_expiry = datetime.now() + timedelta(minutes=50)
-            
+        # Fast path: unlocked read of the cached token. Worst case a stale
+        # reader takes the lock below and finds it already refreshed.
+        if self._access_token and time.monotonic() < self._token_expiry_mono:
             return self._access_token
-            
-        except requests.RequestException as e:
-            print(f"M-Pesa OAuth Error: {e}")
-            return None
+
+        with self._token_lock:
+            # Double-check: another thread may have refreshed while we waited
+            if self._access_token and time.monotonic() < self._token_expiry_mono:
+                return self._access_token
+
+            try:
+                url = f"{self._get_base_url()}/oauth/v1/generate?grant_type=client_credentials"
+
+                # Create Basic Auth header
+                # b2a_base64 is the primitive under base64.b64encode;
+                # calling it directly skips a wrapper frame + allocation
+                credentials = f"{self.consumer_key}:{self.consumer_secret}"
+                encoded_credentials = b2a_base64(credentials.encode(), newline=False).decode('ascii')
+
+                headers = {
+                    "Authorization": f"Basic {encoded_credentials}",
+                    "Content-Type": "application/json"
+                }
+
+                response = self._session.get(url, headers=headers, timeout=30)
+                response.raise_for_status()
+
+                data = response.json()
+                self._access_token = data.get('access_token')
+
+                # Daraja reports expires_in (typically 3600s); refresh 5
+                # minutes early so in-flight requests never race expiry
+                expires_in = int(data.get('expires_in', 3600))
+                self._token_expiry_mono = time.monotonic() + max(expires_in - 300, 60)
+
+                return self._access_token
+
+            except requests.RequestException:
+                log.exception("M-Pesa OAuth error")
+                return None
     
     def _generate_password(self) -> Tuple[str, str]:
         """
@@ -86,8 +136,7 @@ class MpesaClient:
         Password = Base64(Shortcode + Passkey + Timestamp)
         """
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-        password_str = f"{self.shortcode}{self.passkey}{timestamp}"
-        password = base64.b64encode(password_str.encode()).decode()
+        password = b2a_base64(self._pw_prefix + timestamp.encode('ascii'), newline=False).decode('ascii')
         return password, timestamp
     
     def format_phone_number(self, phone: str) -> str:
@@ -95,11 +144,8 @@ class MpesaClient:
         Format phone number to 254XXXXXXXXX format.
         Handles: 0712345678, +254712345678, 254712345678, 712345678
         """
-        phone = phone.strip().replace(" ", "").replace("-", "")
-        
-        if phone.startswith("+"):
-            phone = phone[1:]
-        
+        phone = phone.translate(_PHONE_STRIP)
+
         if phone.startswith("0"):
             phone = "254" + phone[1:]
         elif not phone.startswith("254"):
@@ -158,7 +204,7 @@ class MpesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self._session.post(url, json=payload, headers=headers, timeout=30)
             data = response.json()
             
             if response.status_code == 200 and data.get('ResponseCode') == '0':
@@ -214,7 +260,7 @@ class MpesaClient:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = self._session.post(url, json=payload, headers=headers, timeout=30)
             data = response.json()
             
             result_code = data.get('ResultCode')
@@ -250,7 +296,27 @@ class MpesaClient:
                 'status': 'error',
                 'message': f'Query error: {str(e)}'
             }
-    
+
+    def query_transactions_batch(self, checkout_request_ids: List[str]) -> List[Dict[str, Any]]:
+        """
+        Query several STK Push transactions concurrently.
+
+        Daraja exposes no batch endpoint, so the queries run in parallel
+        on a small thread pool over the shared pooled session - total
+        latency is one round-trip instead of one per transaction.
+
+        Args:
+            checkout_request_ids: CheckoutRequestIDs to query
+
+        Returns:
+            List of status dicts in the same order as the input
+        """
+        if not checkout_request_ids:
+            return []
+        if len(checkout_request_ids) == 1:
+            return [self.query_transaction(checkout_request_ids[0])]
+        return list(_QUERY_EXECUTOR.map(self.query_transaction, checkout_request_ids))
+
     @staticmethod
     def parse_callback(callback_data: Dict) -> Dict[str, Any]:
         """
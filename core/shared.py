@@ -1,4 +1,41 @@
-from core.challenges.challenge_manager import ChallengeManager
-
-# Create shared instances
-challenge_manager = ChallengeManager() 
\ No newline at end of file
+import time
+
+from core.challenges.challenge_manager import ChallengeManager
+
+# Create shared instances
+challenge_manager = ChallengeManager()
+
+# Process-local TTL cache for filtered challenge views. Challenges are
+# near-immutable after startup, so the filter work is done once per TTL
+# window instead of on every /challenges GET. Admin create/update/delete
+# endpoints call clear_challenges_cache() to invalidate eagerly.
+_CHALLENGES_CACHE_TTL = 60  # seconds
+_challenges_cache = {}  # (category, mode) -> (expires_at, filtered dict)
+
+
+def get_challenges_view(category=None, mode=None):
+    """Return active challenges filtered by category/verification mode, cached."""
+    cache_key = (category, mode)
+    cached = _challenges_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    challenges = challenge_manager.get_all_challenges()
+
+    if category:
+        category_lower = category.lower()
+        challenges = {k: v for k, v in challenges.items()
+                      if v.get('category', '').lower() == category_lower}
+
+    if mode == 'buyer':
+        challenges = {k: v for k, v in challenges.items() if v['difficulty'] == 'easy'}
+    elif mode == 'seller':
+        challenges = {k: v for k, v in challenges.items() if v['difficulty'] == 'hard'}
+
+    _challenges_cache[cache_key] = (time.monotonic() + _CHALLENGES_CACHE_TTL, challenges)
+    return challenges
+
+
+def clear_challenges_cache():
+    """Invalidate cached challenge views after admin writes."""
+    _challenges_cache.clear()
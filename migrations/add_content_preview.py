@@ -0,0 +1,32 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from core.database import db_session
+from sqlalchemy import text
+
+def migrate():
+    """Add content_preview column to messages table and backfill it."""
+    try:
+        # Add content_preview column
+        db_session.execute(text("""
+            ALTER TABLE messages
+            ADD COLUMN content_preview VARCHAR(120)
+        """))
+        # Backfill so the inbox query never has to fall back to the
+        # full body for existing messages
+        db_session.execute(text("""
+            UPDATE messages
+            SET content_preview = substr(content, 1, 120)
+        """))
+        db_session.commit()
+        print("Successfully added content_preview column to messages table")
+    except Exception as e:
+        print(f"Error adding content_preview column: {e}")
+        db_session.rollback()
+
+if __name__ == "__main__":
+    migrate()
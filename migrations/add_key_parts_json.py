@@ -0,0 +1,27 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from core.database import db_session
+from sqlalchemy import text
+
+def migrate():
+    """Add key_parts_json column to challenges table."""
+    try:
+        # Add key_parts_json column; existing rows stay NULL - the
+        # minigame bundle cache falls back to splitting the key on read
+        db_session.execute(text("""
+            ALTER TABLE challenges
+            ADD COLUMN key_parts_json JSON
+        """))
+        db_session.commit()
+        print("Successfully added key_parts_json column to challenges table")
+    except Exception as e:
+        print(f"Error adding key_parts_json column: {e}")
+        db_session.rollback()
+
+if __name__ == "__main__":
+    migrate()
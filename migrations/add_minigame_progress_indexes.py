@@ -0,0 +1,46 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from core.database import db_session
+from sqlalchemy import text
+
+def migrate():
+    """Add the unique constraint and lookup index on minigame_progress.
+
+    The ON CONFLICT DO NOTHING insert in MinigameProgress.mark_completed
+    requires the unique index to exist; without it SQLite raises
+    "ON CONFLICT clause does not match any PRIMARY KEY or UNIQUE
+    constraint" and completions are lost.
+    """
+    try:
+        # Duplicate completions may predate the constraint - keep the
+        # earliest row per (user, challenge, minigame) so the unique
+        # index can be built
+        db_session.execute(text("""
+            DELETE FROM minigame_progress
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM minigame_progress
+                GROUP BY user_id, challenge_id, minigame_type
+            )
+        """))
+        db_session.execute(text("""
+            CREATE UNIQUE INDEX IF NOT EXISTS
+            uq_minigame_progress_user_challenge_type
+            ON minigame_progress (user_id, challenge_id, minigame_type)
+        """))
+        db_session.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_mgp_user_chal
+            ON minigame_progress (user_id, challenge_id)
+        """))
+        db_session.commit()
+        print("Successfully added minigame_progress indexes")
+    except Exception as e:
+        print(f"Error adding minigame_progress indexes: {e}")
+        db_session.rollback()
+
+if __name__ == "__main__":
+    migrate()
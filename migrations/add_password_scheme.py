@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from core.database import db_session
+from sqlalchemy import text
+
+def migrate():
+    """Add password_scheme column to users table and label existing hashes."""
+    try:
+        # Add password_scheme column
+        db_session.execute(text("""
+            ALTER TABLE users
+            ADD COLUMN password_scheme VARCHAR(20) DEFAULT 'bcrypt'
+        """))
+        # Existing rows predate the bcrypt layer - label them by hash
+        # format so needs_rehash upgrades them on next login
+        db_session.execute(text("""
+            UPDATE users
+            SET password_scheme = CASE
+                WHEN password_hash LIKE '$2%' THEN 'bcrypt'
+                ELSE 'werkzeug'
+            END
+        """))
+        db_session.commit()
+        print("Successfully added password_scheme column to users table")
+    except Exception as e:
+        print(f"Error adding password_scheme column: {e}")
+        db_session.rollback()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,47 @@
+import os
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from core.database import db_session
+from core.auth.models import User
+from sqlalchemy import text
+from webauthn.helpers import base64url_to_bytes
+
+def migrate():
+    """Convert stored webauthn credential ids from base64url text to bytes.
+
+    The column switched to LargeBinary and registration now stores the
+    raw credential id, so passkeys enrolled before the change no longer
+    match. SQLite keeps the existing column as-is; on Postgres the
+    column type has to change first.
+    """
+    try:
+        bind = db_session.get_bind()
+        if bind.dialect.name == 'postgresql':
+            db_session.execute(text("""
+                ALTER TABLE users
+                ALTER COLUMN webauthn_credential_id TYPE BYTEA
+                USING webauthn_credential_id::bytea
+            """))
+        converted = 0
+        for user in User.query.filter(User.webauthn_credential_id.isnot(None)):
+            stored = user.webauthn_credential_id
+            if isinstance(stored, bytes):
+                continue
+            try:
+                user.webauthn_credential_id = base64url_to_bytes(stored)
+                converted += 1
+            except Exception:
+                # Undecodable value - null it so the user re-enrolls
+                user.webauthn_credential_id = None
+        db_session.commit()
+        print(f"Successfully converted {converted} webauthn credential ids")
+    except Exception as e:
+        print(f"Error converting webauthn credential ids: {e}")
+        db_session.rollback()
+
+if __name__ == "__main__":
+    migrate()
@@ -7,7 +7,8 @@ from datetime import datetime, timedelta
 import json
 import os
 from werkzeug.utils import secure_filename
-from core.shared import challenge_manager  # Import from core.shared instead of app.py
+from core.shared import challenge_manager, clear_challenges_cache  # Import from core.shared instead of app.py
+from routes.minigames import clear_challenge_bundle_cache
 from flask_login import login_required, current_user
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -85,6 +86,8 @@ def create_challenge():
                 hints=[h.strip() for h in request.form.get('hints', '').splitlines() if h.strip()],  # Corrected hints
                 files=saved_files
             )
+            clear_challenges_cache()
+            clear_challenge_bundle_cache()
             flash('Challenge created successfully!', 'success')
             return render_template('admin/create_challenge.html', challenge_info=challenge)
         except ValueError as e:
@@ -113,6 +116,8 @@ def edit_challenge(challenge_id):
 
         try:
             challenge_manager.update_challenge(challenge_id, challenge_data)
+            clear_challenges_cache()
+            clear_challenge_bundle_cache()
             flash('Challenge updated successfully!', 'success')
             return redirect(url_for('admin.admin_dashboard'))
         except ValueError as e:
@@ -127,6 +132,8 @@ def delete_challenge(challenge_id):
     """Delete a challenge."""
     try:
         challenge_manager.delete_challenge(challenge_id)
+        clear_challenges_cache()
+        clear_challenge_bundle_cache()
         flash('Challenge deleted successfully!', 'success')
     except ValueError as e:
         flash(str(e), 'error')
@@ -1,15 +1,27 @@
 from flask import Blueprint, flash, redirect, url_for, render_template, request
+from sqlalchemy import or_
 from core.auth.models import User
 from core.database import db_session
 from datetime import datetime, timedelta
-from werkzeug.security import check_password_hash, generate_password_hash
+from core.auth.passwords import (
+    hash_password,
+    hash_password_async,
+    verify_password,
+    needs_rehash,
+    CURRENT_SCHEME,
+)
 from flask_login import login_user, logout_user, login_required, current_user
-from core.email.service import mail, send_verification_email
-from flask_mail import Message
+from core.email.service import send_email, send_verification_email
 import secrets
 
 auth_bp = Blueprint('auth', __name__)
 
+# Verified against when the username doesn't exist, so unknown-user and
+# wrong-password responses take the same time. Computed once at import;
+# without this the fast unknown-user path leaks which usernames are valid
+# (and gives the LB a bimodal latency profile).
+_DUMMY_PW_HASH = hash_password('__dummy__')
+
 @auth_bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
@@ -26,20 +38,30 @@ def register():
             flash('Passwords do not match', 'error')
             return render_template('auth/register.html')
         
-        # Check if username exists
-        if User.query.filter_by(username=username).first():
+        # Start the bcrypt hash on the KDF pool now so it runs while the
+        # existence SELECTs below make their DB round-trips
+        hash_future = hash_password_async(password)
+
+        # One indexed SELECT covers both existence checks instead of a
+        # round-trip per column
+        conflict_filter = User.username == username
+        if email:
+            conflict_filter = or_(conflict_filter, User.email == email)
+        existing = db_session.query(User.username, User.email).filter(conflict_filter).all()
+
+        if any(row.username == username for row in existing):
             flash('Username already exists', 'error')
             return render_template('auth/register.html')
-        
-        # Check if email exists
-        if email and User.query.filter_by(email=email).first():
+
+        if email and any(row.email == email for row in existing):
             flash('Email already registered. Please login instead.', 'error')
             return redirect(url_for('auth.login'))
-        
+
         # Create user with email verification required
         user = User(
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_future.result(),
+            password_scheme=CURRENT_SCHEME,
             email=email,
             is_active=True,
             is_admin=False,
@@ -110,8 +132,20 @@ def login():
         admin_login = request.form.get('admin_login') == '1'
         
         user = User.query.filter_by(username=username).first()
-        
-        if user and check_password_hash(user.password_hash, password):
+
+        if user:
+            password_ok = verify_password(username, password, user.password_hash)
+            # Lazily upgrade legacy werkzeug hashes to bcrypt
+            if password_ok and needs_rehash(user):
+                user.password_hash = hash_password(password)
+                user.password_scheme = CURRENT_SCHEME
+                db_session.commit()
+        else:
+            # Burn the same KDF work as a real check to keep timing flat
+            verify_password(username, password, _DUMMY_PW_HASH)
+            password_ok = False
+
+        if password_ok:
             # Check email verification
             if not user.email_verified and not user.is_admin:
                 flash('Please verify your email before logging in. Check your inbox for the verification link.', 'warning')
@@ -145,16 +179,19 @@ def logout():
 
 @auth_bp.route('/verify/<token>')
 def verify_email(token):
-    user = User.query.filter_by(email_token=token).first()
-    
-    if not user:
+    # Cheap columns-only probe first - the failure branches (bad or
+    # expired token) never materialize the full User row
+    row = db_session.query(User.id, User.email_token_expiry).filter_by(email_token=token).first()
+
+    if not row:
         flash('Invalid verification link', 'error')
         return redirect(url_for('index'))
-    
-    if user.email_token_expiry < datetime.utcnow():
+
+    if row.email_token_expiry < datetime.utcnow():
         flash('Verification link has expired. Please request a new one.', 'error')
         return redirect(url_for('index'))
-    
+
+    user = db_session.get(User, row.id)
     user.email_verified = True
     user.email_token = None
     user.email_token_expiry = None
@@ -192,21 +229,27 @@ def reset_password(token):
     if current_user.is_authenticated:
         return redirect(url_for('index'))
         
-    user = User.query.filter_by(reset_token=token).first()
-    
-    if not user or user.reset_token_expiry < datetime.utcnow():
+    # Columns-only probe - the GET render and the failure branch only
+    # need to know the token is valid, not the whole row
+    row = db_session.query(User.id, User.reset_token_expiry).filter_by(reset_token=token).first()
+
+    if not row or row.reset_token_expiry < datetime.utcnow():
         flash('Invalid or expired password reset link', 'error')
         return redirect(url_for('auth.login'))
-        
+
     if request.method == 'POST':
         password = request.form['password']
         confirm_password = request.form['confirm_password']
-        
+
         if password != confirm_password:
             flash('Passwords do not match', 'error')
             return render_template('auth/reset_password.html', token=token)
-            
-        user.password_hash = generate_password_hash(password)
+
+        # Overlap the hash with loading the full row
+        hash_future = hash_password_async(password)
+        user = db_session.get(User, row.id)
+        user.password_hash = hash_future.result()
+        user.password_scheme = CURRENT_SCHEME
         user.reset_token = None
         user.reset_token_expiry = None
         db_session.commit()
@@ -217,10 +260,6 @@ def reset_password(token):
     return render_template('auth/reset_password.html', token=token)
 
 def send_password_reset_email(user):
-    msg = Message('Reset your password',
-                 recipients=[user.email])
-    msg.html = render_template('email/reset_password.html',
-                             reset_url=url_for('auth.reset_password',
-                                             token=user.reset_token,
-                                             _external=True))
-    mail.send(msg)
+    reset_url = url_for('auth.reset_password', token=user.reset_token, _external=True)
+    html = render_template('email/reset_password.html', reset_url=reset_url)
+    send_email('Reset your password', [user.email], html)
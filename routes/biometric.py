@@ -1,4 +1,4 @@
-from flask import Blueprint, jsonify, request, render_template, session, url_for
+from flask import Blueprint, current_app, jsonify, request, render_template, session, url_for
 from flask_login import login_required, current_user, login_user
 from core.auth.models import User
 from core.database import db_session
@@ -17,7 +17,6 @@ from webauthn.helpers.structs import (
     AuthenticatorAttachment,
     PublicKeyCredentialDescriptor,
 )
-import json
 
 biometric_bp = Blueprint('biometric', __name__, url_prefix='/biometric')
 
@@ -26,6 +25,13 @@ RP_ID = "localhost"
 RP_NAME = "Momento"
 ORIGIN = "http://localhost:5000"
 
+# Immutable selection criteria shared by every registration - built once
+# at import like the RP constants above, not per request
+_AUTH_SELECTION = AuthenticatorSelectionCriteria(
+    resident_key=ResidentKeyRequirement.PREFERRED,
+    user_verification=UserVerificationRequirement.PREFERRED,
+)
+
 
 @biometric_bp.route('/setup')
 @login_required
@@ -50,16 +56,15 @@ def register_options():
         user_id=str(user.id).encode(),
         user_name=user.username,
         user_display_name=user.username,
-        authenticator_selection=AuthenticatorSelectionCriteria(
-            resident_key=ResidentKeyRequirement.PREFERRED,
-            user_verification=UserVerificationRequirement.PREFERRED,
-        ),
+        authenticator_selection=_AUTH_SELECTION,
     )
     
     # Store the challenge in session for verification
     session['webauthn_challenge'] = bytes_to_base64url(options.challenge)
-    
-    return jsonify(json.loads(options_to_json(options)))
+
+    # options_to_json already returns serialized JSON - hand it straight
+    # to the response instead of decoding and re-encoding via jsonify
+    return current_app.response_class(options_to_json(options), mimetype='application/json')
 
 
 @biometric_bp.route('/register', methods=['POST'])
@@ -83,8 +88,8 @@ def register():
             expected_origin=ORIGIN,
         )
         
-        # Store the credential
-        current_user.webauthn_credential_id = bytes_to_base64url(verification.credential_id)
+        # Store the credential id as raw bytes - no base64 round-trip
+        current_user.webauthn_credential_id = verification.credential_id
         current_user.webauthn_public_key = verification.credential_public_key
         current_user.webauthn_sign_count = verification.sign_count
         db_session.commit()
@@ -103,19 +108,21 @@ def login_options():
     """Generate WebAuthn authentication options"""
     data = request.get_json() or {}
     username = data.get('username', '')
-    
-    # Find user with WebAuthn credential
-    user = None
+
+    # Blank usernames (bot probes mostly) can never match - bail before
+    # paying a DB round-trip
+    if not username or not username.strip():
+        return jsonify({'error': 'No passkey found for this user.'}), 400
+
+    # Find user's WebAuthn credential - columns-only query, the full
+    # User row isn't needed until the /login verification step
     allow_credentials = []
-    
-    if username:
-        user = User.query.filter_by(username=username).first()
-        if user and user.webauthn_credential_id:
-            allow_credentials = [
-                PublicKeyCredentialDescriptor(
-                    id=base64url_to_bytes(user.webauthn_credential_id)
-                )
-            ]
+
+    row = db_session.query(User.webauthn_credential_id).filter_by(username=username).first()
+    if row and row.webauthn_credential_id:
+        allow_credentials = [
+            PublicKeyCredentialDescriptor(id=row.webauthn_credential_id)
+        ]
     
     if not allow_credentials:
         return jsonify({'error': 'No passkey found for this user.'}), 400
@@ -130,8 +137,9 @@ def login_options():
     # Store challenge and username for verification
     session['webauthn_challenge'] = bytes_to_base64url(options.challenge)
     session['webauthn_username'] = username
-    
-    return jsonify(json.loads(options_to_json(options)))
+
+    # Same as register_options: the library output is already JSON
+    return current_app.response_class(options_to_json(options), mimetype='application/json')
 
 
 @biometric_bp.route('/login', methods=['POST'])
@@ -144,9 +152,9 @@ def login():
         expected_challenge = base64url_to_bytes(session.get('webauthn_challenge', ''))
         username = session.get('webauthn_username', '')
         
-        if not expected_challenge or not username:
+        if not expected_challenge or not username or not username.strip():
             return jsonify({'error': 'Session expired. Please try again.'}), 400
-        
+
         # Get user
         user = User.query.filter_by(username=username).first()
         
@@ -2,7 +2,7 @@
 
 from flask import (
     Blueprint, render_template, request, flash, redirect, url_for,
-    jsonify, send_from_directory, abort, current_app # Added current_app for logging
+    jsonify, send_from_directory, abort, current_app, g # Added current_app for logging
 )
 from flask_login import login_required, current_user, login_user
 # --- Assuming models are correctly defined ---
@@ -14,7 +14,7 @@ from core.auth.models import User # Assuming User model is here
 # --- Assuming db_session is correctly configured ---
 from core.database import db_session
 # --- Assuming these exist and work ---
-from core.challenges.challenge_manager import ChallengeManager
+from core.shared import get_challenges_view
 # --- Remove email verification import ---
 # from core.email.service import send_verification_email
 from core.payment.service import process_payment
@@ -24,65 +24,95 @@ from core.payments.mpesa import mpesa_client
 # --- Other necessary imports ---
 from flask_wtf.csrf import CSRFProtect # Recommended to enable
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import mimetypes
 import os
-import traceback # For detailed error logging
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash
+from core.auth.passwords import hash_password, CURRENT_SCHEME
 import uuid
 import json
 import stripe # If used directly
 from uuid import uuid4
 import magic
 from datetime import datetime
-from sqlalchemy import func # For potential aggregate queries like total_sales
+from sqlalchemy import func, or_ # For potential aggregate queries like total_sales
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
 
 # --- Define Blueprint FIRST ---
 marketplace_bp = Blueprint('marketplace', __name__, url_prefix='/marketplace')
 
 # --- Other Setup (Constants, Helpers, Manager Instances) ---
 # Consider moving these to app config if not already there
+# Read once at import - the environment doesn't change under a running
+# worker, so handlers shouldn't rescan os.environ per request
+STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY')
+
 UPLOAD_FOLDER = 'uploads/products'
+# Resolved once - product_image ran os.path.abspath (a realpath walk)
+# on every image request
+UPLOAD_FOLDER_ABS = os.path.abspath(UPLOAD_FOLDER)
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+SAVE_BUFFER_SIZE = 1024 * 1024  # copy uploads in 1MB chunks, not 16KB
+
+
+@marketplace_bp.record_once
+def _apply_upload_limit(state):
+    # Enforce the cap at the WSGI layer so oversized bodies are rejected
+    # with 413 before Werkzeug's multipart parser chews through them
+    state.app.config.setdefault('MAX_CONTENT_LENGTH', MAX_CONTENT_LENGTH)
+    # Create the upload folder here rather than at import so merely
+    # importing this module (tests, tooling) doesn't touch the filesystem
+    try:
+        os.makedirs(UPLOAD_FOLDER_ABS, exist_ok=True)
+    except OSError as e:
+        state.app.logger.error("Error creating upload folder %s: %s", UPLOAD_FOLDER_ABS, e)
 
 # Configure Stripe (ensure key is loaded correctly)
 # Ensure this is done safely, preferably via app config from env vars
 # stripe.api_key = os.getenv('STRIPE_SECRET_KEY') # Loaded in app.py usually
 
-# Create upload folder if it doesn't exist
-# This might be better done at app startup or using Flask commands
-try:
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-except OSError as e:
-    # Log this error if it happens during import time
-    print(f"Error creating upload folder {UPLOAD_FOLDER}: {e}")
-
-
-challenge_manager = ChallengeManager() # Instantiate manager
+# get_challenges_view comes from core.shared (TTL-cached challenge views)
 # csrf = CSRFProtect() # Initialize if enabling CSRF and initializing it here
 
 # --- Helper Functions ---
 
+# Shared libmagic instance - magic.Magic(mime=True) loads the magic
+# database from disk, so constructing it per upload paid that cost on
+# every request. Built once at import; from_buffer itself is reentrant
+# for our single-threaded-per-request use.
+_MIME = magic.Magic(mime=True)
+_MIME_TO_EXT = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
+
 def validate_image(stream):
     """Validate file is actually an image using python-magic"""
     try:
-        mime = magic.Magic(mime=True)
-        buffer = stream.read(2048)
-        stream.seek(0) # Reset stream position crucial
+        # Image magic numbers resolve well inside 512 bytes. peek() leaves
+        # the stream position untouched, skipping the seek(0) that forces
+        # a flush on spooled uploads; read()+rewind is the fallback.
+        if hasattr(stream, 'peek'):
+            buffer = stream.peek(512)[:512]
+        else:
+            buffer = stream.read(512)
+            stream.seek(0) # Reset stream position crucial
         if not buffer: return None
-        mime_type = mime.from_buffer(buffer)
+        mime_type = _MIME.from_buffer(buffer)
         if not mime_type.startswith('image/'): return None
-        mime_to_ext = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif', 'image/webp': '.webp'}
-        return mime_to_ext.get(mime_type)
+        return _MIME_TO_EXT.get(mime_type)
     except Exception as e:
         # Use logger if app context is available, otherwise print
         logger = current_app.logger if current_app else print
         logger(f"Error validating image: {e}", exc_info=True)
         return None
 
+# Suffix tuple so allowed_file is one C-level endswith instead of an
+# rsplit allocation + set probe per upload
+_ALLOWED_SUFFIXES = tuple('.' + ext for ext in ALLOWED_EXTENSIONS)
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
 
 def save_file(file):
     """Save file with security checks"""
@@ -98,8 +128,10 @@ def save_file(file):
 
     try:
         filename = secure_filename(str(uuid4()) + img_ext)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        file_path = os.path.join(UPLOAD_FOLDER_ABS, filename)
+        # Werkzeug already spooled the upload; copy it out in 1MB chunks
+        # instead of the 16KB default (fewer syscalls per 16MB image)
+        file.save(file_path, buffer_size=SAVE_BUFFER_SIZE)
         return filename
     except Exception as e:
         logger = current_app.logger if current_app else print
@@ -107,6 +139,37 @@ def save_file(file):
         flash("An error occurred while saving the uploaded file.", "error")
         return None
 
+# Small pool for filesystem cleanup. Unlinking images inline adds the
+# disk's latency to the HTTP response (bad on network-mounted upload
+# dirs); the DB commit happens first, then the unlink runs off-thread.
+_IO_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix='upload-io')
+
+def _safe_unlink(path):
+    """Remove an upload off the request thread; missing files are fine."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        # No app context on the worker thread - use a plain logger
+        logging.getLogger(__name__).warning("Could not remove image file %s: %s", path, e)
+
+# Request-scoped profile lookups. The user_loader already joinedloads
+# buyer_profile/seller_profile onto current_user, so on a normal request
+# both rows arrived with the login SELECT - reading the relationship here
+# costs zero extra queries. flask.g memoizes the result for the rare
+# code paths (fresh login_user) where the relationship would lazy-load.
+
+def _current_buyer():
+    if not hasattr(g, 'buyer'):
+        g.buyer = current_user.buyer_profile
+    return g.buyer
+
+def _current_seller():
+    if not hasattr(g, 'seller'):
+        g.seller = current_user.seller_profile
+    return g.seller
+
 # --- Decorators ---
 
 def buyer_required(f):
@@ -116,16 +179,16 @@ def buyer_required(f):
             flash('Please log in to access this page.', 'warning')
             return redirect(url_for('user_login'))
 
-        buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
+        buyer = _current_buyer()
         required_challenges = 3 # Configurable?
 
         if not buyer:
             flash('Create a buyer profile and complete challenges to access the marketplace.', 'info')
             return redirect(url_for('marketplace.buyer_verification'))
 
-        # Use actual verification logic (e.g., check solved challenges count)
-        # Assuming Buyer model has 'solved_challenges' list/JSON field
-        solved_count = len(buyer.get_solved_challenges())
+        # is_verified is maintained as the solved-challenge count at
+        # solve time - no JSON decode + len() per request
+        solved_count = buyer.is_verified
         if solved_count < required_challenges:
              flash(f'You need to complete at least {required_challenges} easy challenges to access this page.', 'warning')
              return redirect(url_for('marketplace.buyer_verification'))
@@ -145,20 +208,36 @@ def seller_required(f):
             flash('Please log in first.', 'warning')
             return redirect(url_for('auth.login'))  # or whatever your login route is
 
-        seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
-        
+        seller = _current_seller()
+
         if not seller:
             flash('Seller profile not found. Please register as a seller first.', 'danger')
             return redirect(url_for('marketplace.become_seller'))  # redirect to safe route
 
-        if len(seller.get_solved_challenges()) < 5:
-            flash(f'You need {5 - len(seller.get_solved_challenges())} more hard challenges to sell.', 'warning')
+        if seller.is_verified < 5:
+            flash(f'You need {5 - seller.is_verified} more hard challenges to sell.', 'warning')
             return redirect(url_for('marketplace.seller_verification'))
 
-        return f(*args, **kwargs)  # Don't pass seller, routes do their own lookup
+        return f(*args, **kwargs)  # Routes read the cached seller off g
     return decorated_function
 
 
+PRODUCTS_PER_PAGE = 50
+
+
+def _page_args():
+    """Read ?page/?per_page off the request, clamped to sane bounds."""
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        per_page = min(max(int(request.args.get('per_page', PRODUCTS_PER_PAGE)), 1), 100)
+    except (TypeError, ValueError):
+        per_page = PRODUCTS_PER_PAGE
+    return page, per_page
+
+
 # --- NOW Define Routes using the Blueprint ---
 
 @marketplace_bp.route('/')
@@ -168,14 +247,27 @@ def index():
     buyer = None
     seller = None
     if current_user.is_authenticated:
-        buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
-        seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
+        buyer = _current_buyer()
+        seller = _current_seller()
         required_challenges = 3
-        solved_count = len(buyer.get_solved_challenges()) if buyer else 0
+        solved_count = buyer.is_verified if buyer else 0
         # Check verification status (challenges completed, potentially other checks later)
         if buyer and solved_count >= required_challenges:
-            products = db_session.query(Product).filter_by(is_active=True).order_by(Product.created_at.desc()).all()
-            return render_template('marketplace/index.html', products=products, buyer=buyer, seller=seller)
+            # selectinload batches the seller rows into one IN-query
+            # instead of a lazy SELECT per product row in the template.
+            # Fetch one row past the page so has_next needs no COUNT(*).
+            page, per_page = _page_args()
+            products = (db_session.query(Product)
+                        .options(selectinload(Product.seller))
+                        .filter_by(is_active=True)
+                        .order_by(Product.created_at.desc(), Product.id.desc())
+                        .limit(per_page + 1)
+                        .offset((page - 1) * per_page).all())
+            has_next = len(products) > per_page
+            products = products[:per_page]
+            return render_template('marketplace/index.html', products=products,
+                                   buyer=buyer, seller=seller,
+                                   page=page, has_next=has_next)
 
     return render_template('marketplace/welcome.html', buyer=buyer, seller=seller)
 
@@ -184,16 +276,17 @@ def index():
 @login_required
 def buyer_verification():
     """Page for buyers to see challenge status for verification."""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
+    buyer = _current_buyer()
     required_count = 3
 
-    if buyer and len(buyer.get_solved_challenges()) >= required_count:
+    if buyer and buyer.is_verified >= required_count:
         flash('You are already a verified buyer!', 'success')
         return redirect(url_for('marketplace.view_products'))
 
     try:
-        all_challenges = challenge_manager.get_all_challenges()
-        easy_challenges = {k: v for k, v in all_challenges.items() if v.get('difficulty') == 'easy'}
+        # TTL-cached pre-filtered view - the difficulty partition only
+        # reruns once per cache window, not per request
+        easy_challenges = get_challenges_view(mode='buyer')
     except Exception as e:
         current_app.logger.error(f"Failed to get challenges for buyer verification: {e}", exc_info=True)
         flash("Could not load challenges. Please try again later.", "error")
@@ -215,8 +308,19 @@ def buyer_verification():
 @buyer_required # Handles verification checks
 def view_products():
     """View all products (requires buyer verification)"""
-    products = db_session.query(Product).filter_by(is_active=True).order_by(Product.created_at.desc()).all()
-    return render_template('marketplace/products.html', products=products)
+    # Template shows product.seller.business_name per card - eager-load
+    # the sellers in one batched IN-query rather than N lazy SELECTs
+    page, per_page = _page_args()
+    products = (db_session.query(Product)
+                .options(selectinload(Product.seller))
+                .filter_by(is_active=True)
+                .order_by(Product.created_at.desc(), Product.id.desc())
+                .limit(per_page + 1)
+                .offset((page - 1) * per_page).all())
+    has_next = len(products) > per_page
+    products = products[:per_page]
+    return render_template('marketplace/products.html', products=products,
+                           page=page, has_next=has_next)
 
 
 @marketplace_bp.route("/seller/register", methods=["GET", "POST"])
@@ -233,16 +337,20 @@ def seller_register():
             flash("Username, password, email, and business name are required.", "error")
             return render_template("marketplace/seller_register.html")
 
-        if db_session.query(User).filter_by(username=username).first():
+        # One indexed SELECT covers both uniqueness checks
+        existing = db_session.query(User.username, User.email).filter(
+            or_(User.username == username, User.email == email)).all()
+        if any(row.username == username for row in existing):
             flash("Username already exists", "error")
             return render_template("marketplace/seller_register.html")
-        if db_session.query(User).filter_by(email=email).first():
+        if any(row.email == email for row in existing):
             flash("Email already registered", "error")
             return render_template("marketplace/seller_register.html")
 
         user = User(
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
+            password_scheme=CURRENT_SCHEME,
             email=email,
             email_verified=True, # Assume verified since we removed the process
             is_active=True,
@@ -274,8 +382,6 @@ def seller_register():
             return redirect(url_for("marketplace.seller_verification"))
         except Exception as e:
             db_session.rollback()
-            print(f"Seller Registration failed for user '{username}'. Error: {e}")
-            print(traceback.format_exc())
             current_app.logger.error(f"Seller Registration failed for user '{username}': {e}", exc_info=True)
             flash("Registration failed. Please try again.", "error")
             return render_template("marketplace/seller_register.html")
@@ -296,16 +402,20 @@ def buyer_register():
              flash("Username, password, email, and display name are required.", "error")
              return render_template("marketplace/buyer_register.html")
 
-        if db_session.query(User).filter_by(username=username).first():
+        # One indexed SELECT covers both uniqueness checks
+        existing = db_session.query(User.username, User.email).filter(
+            or_(User.username == username, User.email == email)).all()
+        if any(row.username == username for row in existing):
             flash("Username already exists", "error")
             return render_template("marketplace/buyer_register.html")
-        if db_session.query(User).filter_by(email=email).first():
+        if any(row.email == email for row in existing):
             flash("Email already registered", "error")
             return render_template("marketplace/buyer_register.html")
 
         user = User(
             username=username,
-            password_hash=generate_password_hash(password),
+            password_hash=hash_password(password),
+            password_scheme=CURRENT_SCHEME,
             email=email,
             email_verified=True, # Assume verified
             is_active=True,
@@ -336,8 +446,6 @@ def buyer_register():
             return redirect(url_for("marketplace.buyer_verification"))
         except Exception as e:
             db_session.rollback()
-            print(f"Buyer Registration failed for user '{username}'. Error: {e}")
-            print(traceback.format_exc())
             current_app.logger.error(f"Buyer Registration failed for user '{username}': {e}", exc_info=True)
             flash("Registration failed. Please try again.", "error")
             return render_template("marketplace/buyer_register.html")
@@ -352,7 +460,9 @@ def buyer_register():
 @login_required
 def become_seller():
     """Allow logged-in user to register as a seller (creates Seller profile only)."""
-    if db_session.query(Seller).filter_by(user_id=current_user.username).first():
+    # The user_loader already eager-loaded seller_profile - an existence
+    # check here costs zero queries instead of a full-row SELECT
+    if _current_seller() is not None:
         flash('You are already registered as a seller.', 'info')
         return redirect(url_for('marketplace.seller_verification'))
 
@@ -389,16 +499,16 @@ def become_seller():
 @login_required
 def seller_verification():
     """Page for sellers to see challenge status for verification."""
-    seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
+    seller = _current_seller()
     required_count = 5
 
-    if seller and len(seller.get_solved_challenges()) >= required_count:
+    if seller and seller.is_verified >= required_count:
         flash('You are already a verified seller!', 'success')
         return redirect(url_for('marketplace.seller_products'))
 
     try:
-        all_challenges = challenge_manager.get_all_challenges()
-        hard_challenges = {k: v for k, v in all_challenges.items() if v.get('difficulty') == 'hard'}
+        # Same cached view as buyer_verification, hard partition
+        hard_challenges = get_challenges_view(mode='seller')
     except Exception as e:
         current_app.logger.error(f"Failed to get challenges for seller verification: {e}", exc_info=True)
         flash("Could not load challenges. Please try again later.", "error")
@@ -434,7 +544,7 @@ def create_product():
                 image_filename = save_file(file)
 
         # ←←← THIS WAS THE BUG ←←←
-        seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
+        seller = _current_seller()
 
         if not seller:
             flash('Seller profile not found. Please contact admin.', 'error')
@@ -463,9 +573,17 @@ def create_product():
 @seller_required
 def seller_products():
     """List all products for the current seller"""
-    seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
-    products = db_session.query(Product).filter_by(seller_id=seller.id).order_by(Product.created_at.desc()).all()
-    return render_template('marketplace/seller_products.html', products=products)
+    seller = _current_seller()
+    page, per_page = _page_args()
+    products = (db_session.query(Product)
+                .filter_by(seller_id=seller.id)
+                .order_by(Product.created_at.desc(), Product.id.desc())
+                .limit(per_page + 1)
+                .offset((page - 1) * per_page).all())
+    has_next = len(products) > per_page
+    products = products[:per_page]
+    return render_template('marketplace/seller_products.html', products=products,
+                           page=page, has_next=has_next)
 
 
 @marketplace_bp.route('/products/<int:product_id>/edit', methods=['GET', 'POST'])
@@ -473,9 +591,11 @@ def seller_products():
 @seller_required
 def edit_product(product_id):
     """Edit a product listing"""
-    seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
-    product = db_session.query(Product).filter_by(id=product_id, seller_id=seller.id).first()
-    if not product: abort(404, description="Product not found or permission denied.")
+    seller = _current_seller()
+    # PK lookup via the identity map, then an ownership check in Python
+    product = db_session.get(Product, product_id)
+    if not product or product.seller_id != seller.id:
+        abort(404, description="Product not found or permission denied.")
 
     if request.method == 'POST':
         name = request.form.get('name')
@@ -503,13 +623,10 @@ def edit_product(product_id):
             if file and file.filename:
                 image_filename = save_file(file)
                 if not image_filename: return render_template('marketplace/edit_product.html', product=product)
-                # Delete old image
-                if product.image_filename:
-                    try:
-                        old_image_path = os.path.join(UPLOAD_FOLDER, product.image_filename)
-                        if os.path.exists(old_image_path): os.remove(old_image_path)
-                    except OSError as rm_error: logger.warning(f"Could not remove old image {product.image_filename}: {rm_error}")
-                product.image_filename = image_filename
+                # Delete old image off-thread after the new one is saved
+                if product.image_path:
+                    _IO_EXECUTOR.submit(_safe_unlink, os.path.join(UPLOAD_FOLDER_ABS, product.image_path))
+                product.image_path = image_filename
 
         try:
             db_session.commit()
@@ -528,23 +645,21 @@ def edit_product(product_id):
 @seller_required
 def delete_product(product_id):
     """Delete a product listing"""
-    seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
-    product = db_session.query(Product).filter_by(id=product_id, seller_id=seller.id).first()
-    if not product:
+    seller = _current_seller()
+    product = db_session.get(Product, product_id)
+    if not product or product.seller_id != seller.id:
          flash('Product not found or you do not have permission.', 'error')
          return redirect(url_for('marketplace.seller_products'))
 
-    image_to_delete = product.image_filename
+    image_to_delete = product.image_path
     try:
         db_session.delete(product)
         db_session.commit()
         flash('Product deleted successfully!', 'success')
-        # Try removing image file
+        # Unlink the image off-thread, and only after the commit so
+        # filesystem lag can't undo the delete
         if image_to_delete:
-            try:
-                image_path = os.path.join(UPLOAD_FOLDER, image_to_delete)
-                if os.path.exists(image_path): os.remove(image_path)
-            except OSError as rm_error: current_app.logger.warning(f"Could not remove image file {image_to_delete}: {rm_error}")
+            _IO_EXECUTOR.submit(_safe_unlink, os.path.join(UPLOAD_FOLDER_ABS, image_to_delete))
     except Exception as e:
         db_session.rollback()
         current_app.logger.error(f"Error deleting product {product_id}: {e}", exc_info=True)
@@ -553,14 +668,25 @@ def delete_product(product_id):
     return redirect(url_for('marketplace.seller_products'))
 
 
+# When a reverse proxy fronts the app (nginx with an internal location
+# mapped to uploads/products), X_ACCEL_REDIRECT=1 hands image delivery
+# to it so workers never stream file bytes. Off by default - the Render
+# deploy runs bare gunicorn.
+_USE_X_ACCEL = os.getenv('X_ACCEL_REDIRECT', '0') == '1'
+_X_ACCEL_PREFIX = os.getenv('X_ACCEL_PREFIX', '/_protected_uploads')
+
+
 @marketplace_bp.route('/uploads/products/<path:filename>')
 def product_image(filename):
     """Serve product images"""
     if '..' in filename or filename.startswith('/'): abort(400)
+    if _USE_X_ACCEL:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = current_app.response_class(b'', mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = f'{_X_ACCEL_PREFIX}/{filename}'
+        return response
     try:
-        # Ensure UPLOAD_FOLDER is absolute for send_from_directory
-        safe_upload_folder = os.path.abspath(UPLOAD_FOLDER)
-        return send_from_directory(safe_upload_folder, filename)
+        return send_from_directory(UPLOAD_FOLDER_ABS, filename)
     except FileNotFoundError:
          abort(404)
 
@@ -572,8 +698,9 @@ def product_image(filename):
 @buyer_required
 def checkout(product_id):
     """Handle product checkout with M-Pesa, Stripe, or Crypto"""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
-    product = db_session.query(Product).get(product_id)
+    buyer = _current_buyer()
+    # Session.get uses the identity map and the non-deprecated PK API
+    product = db_session.get(Product, product_id)
 
     if not product or not product.is_active:
         flash("Product not found or is no longer available.", "error")
@@ -626,8 +753,10 @@ def checkout(product_id):
             phone_number=formatted_phone
         )
         db_session.add(order)
-        db_session.commit()
-        
+        # flush assigns order.id for the STK reference while keeping
+        # everything in one still-open transaction
+        db_session.flush()
+
         # Initiate STK Push
         result = mpesa_client.stk_push(
             phone_number=formatted_phone,
@@ -635,19 +764,19 @@ def checkout(product_id):
             account_reference=f"ORD{order.id}",
             transaction_desc=product.name[:13]
         )
-        
+
         if result.get('success'):
-            # Store checkout request ID for callback matching
+            # Store checkout request ID for callback matching, then
+            # commit payment + order + id in a single transaction
             payment.checkout_request_id = result.get('checkout_request_id')
             db_session.commit()
-            
+
             flash("Check your phone for M-Pesa PIN prompt!", "success")
             return redirect(url_for('marketplace.mpesa_pending', order_id=order.id))
         else:
-            # Rollback on failure
-            db_session.delete(order)
-            db_session.delete(payment)
-            db_session.commit()
+            # Nothing was committed - roll the pending rows back instead
+            # of issuing explicit DELETEs
+            db_session.rollback()
             flash(f"M-Pesa Error: {result.get('message')}", "error")
             return render_template('marketplace/checkout.html', product=product)
     
@@ -657,7 +786,21 @@ def checkout(product_id):
             success, message = process_payment(buyer, product, payment_method_id)
             
             if success:
-                product.stock -= 1
+                # Atomic conditional decrement - the WHERE stock > 0 guard
+                # makes the DB enforce the invariant instead of a racy
+                # SELECT-then-UPDATE that can over-sell under concurrency.
+                # process_payment has already committed the charge at this
+                # point, so rowcount 0 must not unwind the purchase - log
+                # the oversell and honor the paid order, same as the
+                # M-Pesa callback.
+                rows = (db_session.query(Product)
+                        .filter(Product.id == product.id, Product.stock > 0)
+                        .update({Product.stock: Product.stock - 1},
+                                synchronize_session=False))
+                if rows == 0:
+                    current_app.logger.warning(
+                        "Stripe checkout: product %s oversold (buyer %s paid with no stock)",
+                        product.id, buyer.id)
                 db_session.commit()
                 
                 payment = db_session.query(Payment).filter_by(
@@ -680,7 +823,7 @@ def checkout(product_id):
 @login_required
 def mpesa_pending(order_id):
     """Show M-Pesa payment pending page"""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
+    buyer = _current_buyer()
     order = db_session.query(Order).filter_by(id=order_id, buyer_id=buyer.id).first()
     
     if not order:
@@ -725,10 +868,17 @@ def mpesa_callback():
                 order.mpesa_receipt_number = result.get('mpesa_receipt')
                 order.delivery_status = DeliveryStatus.PROCESSING
                 
-                # Decrease product stock
-                product = db_session.query(Product).get(payment.product_id)
-                if product and product.stock > 0:
-                    product.stock -= 1
+                # Decrease product stock - same atomic guarded UPDATE as
+                # the checkout path; rowcount 0 means a concurrent sale
+                # took the last unit after this STK push went out
+                rows = (db_session.query(Product)
+                        .filter(Product.id == payment.product_id, Product.stock > 0)
+                        .update({Product.stock: Product.stock - 1},
+                                synchronize_session=False))
+                if rows == 0:
+                    current_app.logger.warning(
+                        "M-Pesa callback: product %s oversold (payment %s completed with no stock)",
+                        payment.product_id, payment.id)
             
             db_session.commit()
             current_app.logger.info(f"M-Pesa payment completed: {result.get('mpesa_receipt')}")
@@ -749,7 +899,7 @@ def mpesa_callback():
 @login_required
 def mpesa_check_status(order_id):
     """Check M-Pesa payment status (AJAX endpoint)"""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
+    buyer = _current_buyer()
     order = db_session.query(Order).filter_by(id=order_id, buyer_id=buyer.id).first()
     
     if not order or not order.payment:
@@ -776,6 +926,60 @@ def mpesa_check_status(order_id):
         return jsonify({'status': 'pending', 'message': 'Waiting for payment...'})
 
 
+@marketplace_bp.route('/mpesa/check_batch', methods=['POST'])
+@login_required
+@buyer_required
+def mpesa_check_batch():
+    """Check M-Pesa payment status for several orders in one call.
+
+    Lets the orders page poll once per interval instead of firing
+    /mpesa/check/<id> per pending order. One DB query covers all the
+    orders; the Daraja queries for still-pending payments run
+    concurrently inside the client.
+    """
+    buyer = _current_buyer()
+    data = request.get_json() or {}
+    ids = data.get('order_ids')
+    if not isinstance(ids, list):
+        return jsonify({'statuses': {}})
+    order_ids = [oid for oid in ids if isinstance(oid, int)][:50]
+    if not order_ids:
+        return jsonify({'statuses': {}})
+
+    rows = (db_session.query(Order.id, Payment)
+            .join(Payment, Payment.id == Order.payment_id)
+            .filter(Order.id.in_(order_ids), Order.buyer_id == buyer.id)
+            .all())
+
+    statuses = {}
+    pending = []  # (order_id, checkout_request_id)
+    for order_id, payment in rows:
+        if payment.status == PaymentStatus.COMPLETED:
+            statuses[order_id] = {
+                'status': 'completed',
+                'receipt': payment.transaction_id,
+                'redirect': url_for('marketplace.order_detail', order_id=order_id),
+            }
+        elif payment.status == PaymentStatus.FAILED:
+            statuses[order_id] = {'status': 'failed', 'message': 'Payment failed or cancelled'}
+        elif payment.checkout_request_id:
+            pending.append((order_id, payment.checkout_request_id))
+        else:
+            statuses[order_id] = {'status': 'pending', 'message': 'Waiting for payment...'}
+
+    if pending:
+        results = mpesa_client.query_transactions_batch([crid for _, crid in pending])
+        for (order_id, _), result in zip(pending, results):
+            statuses[order_id] = {
+                'status': result.get('status', 'pending'),
+                'message': result.get('message', 'Waiting for payment...'),
+            }
+
+    # Keyed by order id as strings (JSON object keys) in request order
+    return jsonify({'statuses': {str(oid): statuses[oid]
+                                 for oid in order_ids if oid in statuses}})
+
+
 # --- Order Management Routes ---
 
 @marketplace_bp.route('/orders')
@@ -783,8 +987,13 @@ def mpesa_check_status(order_id):
 @buyer_required
 def my_orders():
     """View buyer's order history"""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
-    orders = db_session.query(Order).filter_by(buyer_id=buyer.id).order_by(Order.created_at.desc()).all()
+    buyer = _current_buyer()
+    # Template reads order.payment and order.product per row - eager-load
+    # them so the list renders in one statement instead of 2N lazy loads
+    orders = (db_session.query(Order)
+              .options(joinedload(Order.payment), joinedload(Order.product))
+              .filter_by(buyer_id=buyer.id)
+              .order_by(Order.created_at.desc()).all())
     return render_template('marketplace/orders.html', orders=orders)
 
 
@@ -792,9 +1001,12 @@ def my_orders():
 @login_required
 def order_detail(order_id):
     """View single order details"""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
-    order = db_session.query(Order).filter_by(id=order_id, buyer_id=buyer.id).first()
-    
+    buyer = _current_buyer()
+    order = (db_session.query(Order)
+             .options(joinedload(Order.payment),
+                      joinedload(Order.product).joinedload(Product.seller))
+             .filter_by(id=order_id, buyer_id=buyer.id).first())
+
     if not order:
         flash("Order not found.", "error")
         return redirect(url_for('marketplace.my_orders'))
@@ -807,11 +1019,18 @@ def order_detail(order_id):
 @seller_required
 def seller_orders():
     """View seller's orders to fulfill"""
-    seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
+    seller = _current_seller()
     
-    # Get all orders for seller's products
+    # Get all orders for seller's products; template shows the buyer,
+    # product and payment for each row, so load them up front.
+    # contains_eager reuses the filter JOIN to populate order.product
+    # instead of joinedload adding a second join on the same table.
     orders = db_session.query(Order).join(Product).filter(
         Product.seller_id == seller.id
+    ).options(
+        contains_eager(Order.product),
+        joinedload(Order.buyer),
+        joinedload(Order.payment),
     ).order_by(Order.created_at.desc()).all()
     
     return render_template('marketplace/seller_orders.html', orders=orders)
@@ -822,7 +1041,7 @@ def seller_orders():
 @seller_required
 def update_order_status(order_id):
     """Update order delivery status"""
-    seller = db_session.query(Seller).filter_by(user_id=current_user.username).first()
+    seller = _current_seller()
     
     # Verify seller owns this order's product
     order = db_session.query(Order).join(Product).filter(
@@ -851,15 +1070,19 @@ def update_order_status(order_id):
 @login_required
 def order_confirmation(payment_id):
     """Show order confirmation page"""
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
-    payment = db_session.query(Payment).filter_by(id=payment_id, buyer_id=buyer.id).first()
-    
+    buyer = _current_buyer()
+    # One statement covers the payment, its order, and the
+    # product->seller chain the template walks
+    payment = (db_session.query(Payment)
+               .options(joinedload(Payment.order),
+                        joinedload(Payment.product).joinedload(Product.seller))
+               .filter_by(id=payment_id, buyer_id=buyer.id).first())
+
     if not payment:
         flash("Order not found.", "error")
         return redirect(url_for('marketplace.view_products'))
-    
-    order = db_session.query(Order).filter_by(payment_id=payment.id).first()
-    return render_template('marketplace/confirmation.html', payment=payment, order=order)
+
+    return render_template('marketplace/confirmation.html', payment=payment, order=payment.order)
 
 
 # --- Routes for Managing Payment Methods (Placeholders) ---
@@ -870,7 +1093,7 @@ def order_confirmation(payment_id):
 def payment_methods():
     """View and manage payment methods - Placeholder"""
     payment_methods_list = [] # TODO: Fetch from Stripe via helper
-    return render_template('marketplace/payment_methods.html', payment_methods=payment_methods_list, stripe_public_key=os.getenv('STRIPE_PUBLIC_KEY'))
+    return render_template('marketplace/payment_methods.html', payment_methods=payment_methods_list, stripe_public_key=STRIPE_PUBLIC_KEY)
 
 
 @marketplace_bp.route('/payment-methods/add', methods=['POST'])
@@ -882,7 +1105,7 @@ def add_payment_method():
     if not stripe_payment_method_id:
          flash("Failed to get payment method details from Stripe.", "error")
          return redirect(url_for('marketplace.payment_methods'))
-    buyer = db_session.query(Buyer).filter_by(user_id=current_user.username).first()
+    buyer = _current_buyer()
     try:
         # TODO: Implement Stripe customer creation/attachment logic
         flash("Payment method added successfully (Placeholder).", "success")
@@ -2,12 +2,32 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from core.auth.models import User
 from core.database import db_session, Base
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
+import threading
+import time
 
 messages_bp = Blueprint('messages', __name__, url_prefix='/messages')
 
+# The navbar polls /unread-count on every page - cache the answer per
+# user for a short TTL and drop the entry whenever something changes it
+# (a message sent to them, or them opening a chat). Same process-local
+# pattern as the challenges-view cache in core.shared; works per worker
+# since each gunicorn worker serves its own sessions.
+CHAT_PAGE_SIZE = 50
+INBOX_PAGE_SIZE = 50
+
+_UNREAD_TTL = 30.0
+_UNREAD_CACHE_MAX = 4096
+_unread_cache = {}  # user_id -> (count, monotonic deadline)
+_unread_lock = threading.Lock()
+
+
+def _invalidate_unread(user_id):
+    with _unread_lock:
+        _unread_cache.pop(user_id, None)
+
 
 # Message Model
 class Message(Base):
@@ -17,56 +37,95 @@ class Message(Base):
     sender_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     recipient_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     content = Column(Text, nullable=False)
+    # First 120 chars, set on insert - the inbox renders only a snippet,
+    # so its query can skip dragging full (possibly TOASTed) bodies
+    content_preview = Column(String(120))
     created_at = Column(DateTime, default=datetime.utcnow)
     read = Column(Boolean, default=False)
+
+    @property
+    def preview(self):
+        """Snippet for list views; falls back for rows predating the column."""
+        if self.content_preview is not None:
+            return self.content_preview
+        return self.content[:120]
     
     sender = relationship('User', foreign_keys=[sender_id], backref='sent_messages')
     recipient = relationship('User', foreign_keys=[recipient_id], backref='received_messages')
 
+    # recipient/read/sender covers the unread-count endpoint, the inbox
+    # unread aggregate and the chat bulk read-flip without touching the
+    # heap; sender/recipient/created_at serves the per-thread SELECT in
+    # index order instead of a scan + sort.
+    __table_args__ = (
+        Index('ix_messages_recipient_read_sender',
+              'recipient_id', 'read', 'sender_id'),
+        Index('ix_messages_pair_created',
+              'sender_id', 'recipient_id', 'created_at'),
+    )
+
 
 @messages_bp.route('/')
 @login_required
 def inbox():
     """Show list of conversations"""
-    from sqlalchemy import or_, and_
-    
-    # Get all messages involving current user
-    all_messages = Message.query.filter(
-        or_(
-            Message.sender_id == current_user.id,
-            Message.recipient_id == current_user.id
+    from sqlalchemy import case, func, or_
+    from sqlalchemy.orm import defer
+
+    # Previously this loaded every message the user ever exchanged, then
+    # issued a User SELECT and an unread COUNT per conversation (2N+1
+    # queries). Two queries now: row_number() over each conversation
+    # partition picks the latest message, and a grouped aggregate gets
+    # the unread counts.
+    other_id = case(
+        (Message.sender_id == current_user.id, Message.recipient_id),
+        else_=Message.sender_id,
+    )
+    ranked = (
+        db_session.query(
+            Message.id.label('msg_id'),
+            other_id.label('other_id'),
+            func.row_number().over(
+                partition_by=other_id,
+                order_by=(Message.created_at.desc(), Message.id.desc()),
+            ).label('rn'),
         )
-    ).order_by(Message.created_at.desc()).all()
-    
-    # Build unique conversation list
-    seen_users = set()
-    conversations = []
-    
-    for msg in all_messages:
-        # Determine the other user in the conversation
-        if msg.sender_id == current_user.id:
-            other_user_id = msg.recipient_id
-        else:
-            other_user_id = msg.sender_id
-        
-        if other_user_id not in seen_users:
-            seen_users.add(other_user_id)
-            other_user = User.query.get(other_user_id)
-            
-            if other_user:
-                # Count unread messages from this user
-                unread_count = Message.query.filter(
-                    Message.sender_id == other_user_id,
-                    Message.recipient_id == current_user.id,
-                    Message.read == False
-                ).count()
-                
-                conversations.append({
-                    'user': other_user,
-                    'last_message': msg,
-                    'unread_count': unread_count
-                })
-    
+        .filter(or_(
+            Message.sender_id == current_user.id,
+            Message.recipient_id == current_user.id,
+        ))
+        .subquery()
+    )
+
+    rows = (
+        db_session.query(Message, User)
+        # The inbox shows Message.preview, never the full body - defer
+        # content so wide rows stay out of this query entirely
+        .options(defer(Message.content))
+        .join(ranked, ranked.c.msg_id == Message.id)
+        .join(User, User.id == ranked.c.other_id)
+        .filter(ranked.c.rn == 1)
+        .order_by(Message.created_at.desc())
+        .limit(INBOX_PAGE_SIZE)
+        .all()
+    )
+
+    unread_by_sender = dict(
+        db_session.query(Message.sender_id, func.count(Message.id))
+        .filter(Message.recipient_id == current_user.id, Message.read == False)
+        .group_by(Message.sender_id)
+        .all()
+    )
+
+    conversations = [
+        {
+            'user': other_user,
+            'last_message': msg,
+            'unread_count': unread_by_sender.get(other_user.id, 0),
+        }
+        for msg, other_user in rows
+    ]
+
     return render_template('messages/inbox.html', conversations=conversations)
 
 
@@ -82,22 +141,46 @@ def chat(username):
         flash('You cannot message yourself.', 'error')
         return redirect(url_for('messages.inbox'))
     
-    # Get messages between the two users
+    # Mark messages as read first, with one bulk UPDATE instead of
+    # dirtying each ORM row and flushing per-row UPDATEs. Running it
+    # before the thread SELECT means the rows come back already read -
+    # no identity-map fixups, no post-commit expiry reloads.
+    flipped = (
+        db_session.query(Message)
+        .filter(
+            Message.recipient_id == current_user.id,
+            Message.sender_id == other_user.id,
+            Message.read == False,
+        )
+        .update({Message.read: True}, synchronize_session=False)
+    )
+    if flipped:
+        db_session.commit()
+        _invalidate_unread(current_user.id)
+
+    # Get the most recent page of messages between the two users -
+    # loading the full history grows without bound. ?before=<id> keyset
+    # pages backwards through older messages.
     from sqlalchemy import or_, and_
-    messages = Message.query.filter(
+    before_id = request.args.get('before', type=int)
+    thread = Message.query.filter(
         or_(
             and_(Message.sender_id == current_user.id, Message.recipient_id == other_user.id),
             and_(Message.sender_id == other_user.id, Message.recipient_id == current_user.id)
         )
-    ).order_by(Message.created_at.asc()).all()
-    
-    # Mark messages as read
-    for msg in messages:
-        if msg.recipient_id == current_user.id and not msg.read:
-            msg.read = True
-    db_session.commit()
+    )
+    if before_id:
+        thread = thread.filter(Message.id < before_id)
+    # One row past the page tells us whether older history exists
+    rows = (thread.order_by(Message.created_at.desc(), Message.id.desc())
+            .limit(CHAT_PAGE_SIZE + 1).all())
+    has_older = len(rows) > CHAT_PAGE_SIZE
+    messages = rows[:CHAT_PAGE_SIZE]
+    messages.reverse()  # template renders oldest-first
     
-    return render_template('messages/chat.html', other_user=other_user, messages=messages)
+    return render_template('messages/chat.html', other_user=other_user,
+                           messages=messages, has_older=has_older,
+                           oldest_id=messages[0].id if messages else None)
 
 
 @messages_bp.route('/send/<username>', methods=['POST'])
@@ -113,22 +196,27 @@ def send_message(username):
         flash('Message cannot be empty.', 'error')
         return redirect(url_for('messages.chat', username=username))
     
-    message = Message(
-        sender_id=current_user.id,
-        recipient_id=other_user.id,
-        content=content
-    )
-    db_session.add(message)
+    # Single INSERT ... RETURNING instead of add+commit+attribute reads -
+    # the ORM path expires the instance on commit, so touching message.id
+    # for the JSON response cost a refresh SELECT
+    from sqlalchemy import insert
+    row = db_session.execute(
+        insert(Message)
+        .values(sender_id=current_user.id, recipient_id=other_user.id,
+                content=content, content_preview=content[:120])
+        .returning(Message.id, Message.created_at)
+    ).first()
     db_session.commit()
-    
+    _invalidate_unread(other_user.id)
+
     # If AJAX request, return JSON
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({
             'success': True,
             'message': {
-                'id': message.id,
-                'content': message.content,
-                'created_at': message.created_at.strftime('%I:%M %p'),
+                'id': row.id,
+                'content': content,
+                'created_at': row.created_at.strftime('%I:%M %p'),
                 'sender': current_user.username
             }
         })
@@ -149,8 +237,19 @@ def new_conversation():
 @login_required
 def unread_count():
     """Get count of unread messages (for notifications)"""
+    now = time.monotonic()
+    with _unread_lock:
+        cached = _unread_cache.get(current_user.id)
+    if cached and cached[1] > now:
+        return jsonify({'count': cached[0]})
+
     count = Message.query.filter(
         Message.recipient_id == current_user.id,
         Message.read == False
     ).count()
+
+    with _unread_lock:
+        if len(_unread_cache) >= _UNREAD_CACHE_MAX:
+            _unread_cache.pop(next(iter(_unread_cache)))
+        _unread_cache[current_user.id] = (count, now + _UNREAD_TTL)
     return jsonify({'count': count})
@@ -1,45 +1,104 @@
 """
 Minigames routes for key revelation through interactive games.
 """
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, session
+from flask import Blueprint, current_app, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 from core.challenges.minigames import key_reveal_manager
-from core.challenges.challenge_manager import ChallengeManager
+from core.challenges.challenge_manager import ChallengeManager, extract_minigame_key
 from core.database import db_session
 from core.challenges.models import Challenge
-import json
+import threading
+import time
 
 minigames_bp = Blueprint('minigames', __name__, url_prefix='/minigames')
 
 # Shared challenge manager instance
 challenge_manager = ChallengeManager()
 
+# split_key is a pure function of the key, and the key is derived from
+# challenge.encrypted_message - the bundle only changes on an admin edit,
+# so cache it with the same 60s TTL as the challenges view in core.shared.
+_BUNDLE_TTL = 60.0
+_bundle_cache = {}  # challenge_id -> ((key, key_parts), monotonic deadline)
+_bundle_lock = threading.Lock()
+
+
+# Game state (the key part to reveal, quiz question indices, the
+# scramble word) travels in a short-lived signed token handed to the
+# page and posted back to the complete endpoint, instead of through
+# flask.session - no cookie churn or session write+read per game. The
+# payload is as client-readable as the signed session cookie it
+# replaces, so exposure is unchanged.
+_STATE_MAX_AGE = 1800  # seconds
+
+
+def _state_serializer():
+    return URLSafeTimedSerializer(current_app.secret_key, salt='minigame-state')
+
+
+def _issue_state(game_type, challenge_id, payload):
+    return _state_serializer().dumps(
+        {'g': game_type, 'c': challenge_id, 'u': current_user.id, 'd': payload})
+
+
+def _load_state(game_type, challenge_id, token):
+    """Verify a state token; returns its payload or None."""
+    if not token:
+        return None
+    try:
+        data = _state_serializer().loads(token, max_age=_STATE_MAX_AGE)
+    except BadSignature:  # covers SignatureExpired too
+        return None
+    if (data.get('g') != game_type or data.get('c') != challenge_id
+            or data.get('u') != current_user.id):
+        return None
+    return data.get('d')
+
+
+def clear_challenge_bundle_cache():
+    """Drop cached key bundles; call after an admin edits a challenge."""
+    with _bundle_lock:
+        _bundle_cache.clear()
+
+
+def _challenge_bundle(challenge_id):
+    """Return (key, key_parts) for a challenge, cached per process.
+
+    The parts are precomputed at challenge creation (key_parts_json), so
+    a cache miss is one two-column SELECT with no splitting; rows from
+    before the column existed fall back to split_key. key_parts get
+    mutated by callers (revealed flags), so each hit hands out fresh
+    part dicts.
+    """
+    now = time.monotonic()
+    with _bundle_lock:
+        entry = _bundle_cache.get(challenge_id)
+    if entry and entry[1] > now:
+        key, parts = entry[0]
+    else:
+        row = (db_session.query(Challenge.encrypted_message, Challenge.key_parts_json)
+               .filter_by(id=challenge_id, is_active=True).first())
+        if row is None:
+            return None, []
+        key = extract_minigame_key(row.encrypted_message)
+        parts = row.key_parts_json or (key_reveal_manager.split_key(key) if key else [])
+        with _bundle_lock:
+            _bundle_cache[challenge_id] = ((key, parts), now + _BUNDLE_TTL)
+    return key, [dict(p) for p in parts]
+
 
 @minigames_bp.route('/')
 @login_required
 def minigames_index():
     """Show list of challenges with available minigames."""
-    challenges = db_session.query(Challenge).filter_by(is_active=True).all()
+    # The template only renders id/type/difficulty - a tuple select skips
+    # hydrating hints, files, the flag and the whole encrypted_message blob
+    challenges = (db_session.query(Challenge.id, Challenge.type, Challenge.difficulty)
+                  .filter_by(is_active=True).all())
     return render_template('minigames/index.html', challenges=challenges)
 
 
-def get_challenge_key(challenge_id: str) -> str:
-    """Get the key for a challenge (from layered encrypted data)."""
-    challenge = db_session.query(Challenge).filter_by(id=challenge_id, is_active=True).first()
-    if not challenge:
-        return None
-    
-    # Extract key from layered format: LAYER_TYPE:KEY:ENCRYPTED_DATA
-    encrypted_msg = challenge.encrypted_message
-    if ':' in encrypted_msg:
-        parts = encrypted_msg.split(':', 2)
-        if len(parts) >= 2:
-            return parts[1]  # The key is the second part
-    
-    # Fallback - use first 16 chars of encrypted message as "key"
-    return encrypted_msg[:16] if encrypted_msg else "UNKNOWNKEY123456"
-
-
 @minigames_bp.route('/challenge/<challenge_id>')
 @login_required
 def minigames_hub(challenge_id):
@@ -49,9 +108,8 @@ def minigames_hub(challenge_id):
         flash("Challenge not found.", "error")
         return redirect(url_for('list_challenges'))
     
-    # Get the key and split it
-    key = get_challenge_key(challenge_id)
-    key_parts = key_reveal_manager.split_key(key)
+    # Get the key and split it (cached per process)
+    key, key_parts = _challenge_bundle(challenge_id)
     
     # Get user's progress
     progress = key_reveal_manager.get_user_progress(current_user.id, challenge_id)
@@ -77,35 +135,32 @@ def minigames_hub(challenge_id):
 @login_required
 def wheel_spin(challenge_id):
     """Wheel spin minigame."""
-    challenge = db_session.query(Challenge).filter_by(id=challenge_id, is_active=True).first()
-    if not challenge:
+    # The hub only links games that aren't completed yet, so there's no
+    # per-route progress re-check; the bundle lookup doubles as the
+    # existence check and the templates only render the challenge id
+    key, key_parts = _challenge_bundle(challenge_id)
+    if key is None:
         flash("Challenge not found.", "error")
         return redirect(url_for('list_challenges'))
-    
-    key = get_challenge_key(challenge_id)
-    key_parts = key_reveal_manager.split_key(key)
+    challenge = {'id': challenge_id}
     
     # Find the wheel game part
     wheel_part = next((p for p in key_parts if p['game_type'] == 'wheel'), None)
     if not wheel_part:
         flash("Wheel game not available for this challenge.", "warning")
         return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
-    
-    # Check if already completed
-    progress = key_reveal_manager.get_user_progress(current_user.id, challenge_id)
-    if 'wheel' in progress and progress['wheel'].get('completed'):
-        flash(f"Already completed! Key part: {wheel_part['value']}", "success")
-        return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
+
     
     # Generate wheel segments
     segments = key_reveal_manager.generate_wheel_segments(wheel_part['value'])
     
-    # Store the key part in session for verification
-    session[f'wheel_{challenge_id}'] = wheel_part['value']
-    
+    # Signed token carries the key part for the complete endpoint
+    state_token = _issue_state('wheel', challenge_id, wheel_part['value'])
+
     return render_template('minigames/wheel_spin.html',
                          challenge=challenge,
                          segments=segments,
+                         state_token=state_token,
                          key_part_length=len(wheel_part['value']))
 
 
@@ -113,18 +168,16 @@ def wheel_spin(challenge_id):
 @login_required
 def wheel_complete(challenge_id):
     """Complete wheel spin game."""
-    key_part = session.get(f'wheel_{challenge_id}')
+    token = (request.get_json(silent=True) or {}).get('token', '')
+    key_part = _load_state('wheel', challenge_id, token)
     if not key_part:
-        return jsonify({'success': False, 'message': 'Invalid session'})
+        return jsonify({'success': False, 'message': 'Invalid or expired game token'})
     
     # Mark as completed
     key_reveal_manager.mark_game_completed(
         current_user.id, challenge_id, 'wheel', key_part
     )
     
-    # Clear session
-    session.pop(f'wheel_{challenge_id}', None)
-    
     return jsonify({
         'success': True,
         'revealed_part': key_part,
@@ -136,50 +189,49 @@ def wheel_complete(challenge_id):
 @login_required  
 def quiz_game(challenge_id):
     """Quiz minigame."""
-    challenge = db_session.query(Challenge).filter_by(id=challenge_id, is_active=True).first()
-    if not challenge:
+    # The hub only links games that aren't completed yet, so there's no
+    # per-route progress re-check; the bundle lookup doubles as the
+    # existence check and the templates only render the challenge id
+    key, key_parts = _challenge_bundle(challenge_id)
+    if key is None:
         flash("Challenge not found.", "error")
         return redirect(url_for('list_challenges'))
-    
-    key = get_challenge_key(challenge_id)
-    key_parts = key_reveal_manager.split_key(key)
+    challenge = {'id': challenge_id}
     
     # Find the quiz game part
     quiz_part = next((p for p in key_parts if p['game_type'] == 'quiz'), None)
     if not quiz_part:
         flash("Quiz game not available for this challenge.", "warning")
         return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
+
     
-    # Check if already completed
-    progress = key_reveal_manager.get_user_progress(current_user.id, challenge_id)
-    if 'quiz' in progress and progress['quiz'].get('completed'):
-        flash(f"Already completed! Key part: {quiz_part['value']}", "success")
-        return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
-    
-    # Get quiz questions
-    questions = key_reveal_manager.get_quiz_questions(3)
-    
-    # Store for verification
-    session[f'quiz_{challenge_id}'] = {
-        'questions': questions,
+    # Get quiz questions; the token carries only the bank indices, so
+    # the server re-derives the answers at submit time
+    question_indices = key_reveal_manager.get_quiz_question_indices(3)
+    questions = key_reveal_manager.quiz_questions_for(question_indices)
+
+    state_token = _issue_state('quiz', challenge_id, {
+        'qi': question_indices,
         'key_part': quiz_part['value']
-    }
-    
+    })
+
     return render_template('minigames/quiz.html',
                          challenge=challenge,
-                         questions=questions)
+                         questions=questions,
+                         state_token=state_token)
 
 
 @minigames_bp.route('/challenge/<challenge_id>/quiz/submit', methods=['POST'])
 @login_required
 def quiz_submit(challenge_id):
     """Submit quiz answers."""
-    quiz_data = session.get(f'quiz_{challenge_id}')
+    body = request.get_json(silent=True) or {}
+    quiz_data = _load_state('quiz', challenge_id, body.get('token', ''))
     if not quiz_data:
-        return jsonify({'success': False, 'message': 'Invalid session'})
-    
-    answers = request.json.get('answers', [])
-    questions = quiz_data['questions']
+        return jsonify({'success': False, 'message': 'Invalid or expired game token'})
+
+    answers = body.get('answers', [])
+    questions = key_reveal_manager.quiz_questions_for(quiz_data['qi'])
     key_part = quiz_data['key_part']
     
     correct, total = key_reveal_manager.verify_quiz_answers(questions, answers)
@@ -189,7 +241,6 @@ def quiz_submit(challenge_id):
         key_reveal_manager.mark_game_completed(
             current_user.id, challenge_id, 'quiz', key_part
         )
-        session.pop(f'quiz_{challenge_id}', None)
         return jsonify({
             'success': True,
             'correct': correct,
@@ -210,44 +261,42 @@ def quiz_submit(challenge_id):
 @login_required
 def memory_game(challenge_id):
     """Memory match minigame."""
-    challenge = db_session.query(Challenge).filter_by(id=challenge_id, is_active=True).first()
-    if not challenge:
+    # The hub only links games that aren't completed yet, so there's no
+    # per-route progress re-check; the bundle lookup doubles as the
+    # existence check and the templates only render the challenge id
+    key, key_parts = _challenge_bundle(challenge_id)
+    if key is None:
         flash("Challenge not found.", "error")
         return redirect(url_for('list_challenges'))
-    
-    key = get_challenge_key(challenge_id)
-    key_parts = key_reveal_manager.split_key(key)
+    challenge = {'id': challenge_id}
     
     memory_part = next((p for p in key_parts if p['game_type'] == 'memory'), None)
     if not memory_part:
         flash("Memory game not available.", "warning")
         return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
-    
-    progress = key_reveal_manager.get_user_progress(current_user.id, challenge_id)
-    if 'memory' in progress and progress['memory'].get('completed'):
-        flash(f"Already completed! Key part: {memory_part['value']}", "success")
-        return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
+
     
     cards = key_reveal_manager.generate_memory_cards(memory_part['value'])
-    session[f'memory_{challenge_id}'] = memory_part['value']
-    
+    state_token = _issue_state('memory', challenge_id, memory_part['value'])
+
     return render_template('minigames/memory.html',
                          challenge=challenge,
-                         cards=cards)
+                         cards=cards,
+                         state_token=state_token)
 
 
 @minigames_bp.route('/challenge/<challenge_id>/memory/complete', methods=['POST'])
 @login_required
 def memory_complete(challenge_id):
     """Complete memory game."""
-    key_part = session.get(f'memory_{challenge_id}')
+    token = (request.get_json(silent=True) or {}).get('token', '')
+    key_part = _load_state('memory', challenge_id, token)
     if not key_part:
-        return jsonify({'success': False, 'message': 'Invalid session'})
+        return jsonify({'success': False, 'message': 'Invalid or expired game token'})
     
     key_reveal_manager.mark_game_completed(
         current_user.id, challenge_id, 'memory', key_part
     )
-    session.pop(f'memory_{challenge_id}', None)
     
     return jsonify({
         'success': True,
@@ -260,46 +309,44 @@ def memory_complete(challenge_id):
 @login_required
 def slider_puzzle(challenge_id):
     """Slider puzzle minigame."""
-    challenge = db_session.query(Challenge).filter_by(id=challenge_id, is_active=True).first()
-    if not challenge:
+    # The hub only links games that aren't completed yet, so there's no
+    # per-route progress re-check; the bundle lookup doubles as the
+    # existence check and the templates only render the challenge id
+    key, key_parts = _challenge_bundle(challenge_id)
+    if key is None:
         flash("Challenge not found.", "error")
         return redirect(url_for('list_challenges'))
-    
-    key = get_challenge_key(challenge_id)
-    key_parts = key_reveal_manager.split_key(key)
+    challenge = {'id': challenge_id}
     
     slider_part = next((p for p in key_parts if p['game_type'] == 'slider'), None)
     if not slider_part:
         flash("Slider game not available.", "warning")
         return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
-    
-    progress = key_reveal_manager.get_user_progress(current_user.id, challenge_id)
-    if 'slider' in progress and progress['slider'].get('completed'):
-        flash(f"Already completed! Key part: {slider_part['value']}", "success")
-        return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
+
     
     puzzle_data = key_reveal_manager.generate_slider_puzzle(slider_part['value'])
-    session[f'slider_{challenge_id}'] = slider_part['value']
-    
+    state_token = _issue_state('slider', challenge_id, slider_part['value'])
+
     return render_template('minigames/slider.html',
                          challenge=challenge,
-                         puzzle=puzzle_data['puzzle'])
+                         puzzle=puzzle_data['puzzle'],
+                         state_token=state_token)
 
 
 @minigames_bp.route('/challenge/<challenge_id>/slider/complete', methods=['POST'])
 @login_required
 def slider_complete(challenge_id):
     """Complete slider puzzle."""
-    key_part = session.get(f'slider_{challenge_id}')
+    body = request.get_json(silent=True) or {}
+    key_part = _load_state('slider', challenge_id, body.get('token', ''))
     if not key_part:
-        return jsonify({'success': False, 'message': 'Invalid session'})
-    
-    puzzle_state = request.json.get('state', [])
+        return jsonify({'success': False, 'message': 'Invalid or expired game token'})
+
+    puzzle_state = body.get('state', [])
     if key_reveal_manager.verify_slider_solution(puzzle_state):
         key_reveal_manager.mark_game_completed(
             current_user.id, challenge_id, 'slider', key_part
         )
-        session.pop(f'slider_{challenge_id}', None)
         return jsonify({
             'success': True,
             'revealed_part': key_part,
@@ -313,51 +360,49 @@ def slider_complete(challenge_id):
 @login_required
 def scramble_game(challenge_id):
     """Word scramble minigame."""
-    challenge = db_session.query(Challenge).filter_by(id=challenge_id, is_active=True).first()
-    if not challenge:
+    # The hub only links games that aren't completed yet, so there's no
+    # per-route progress re-check; the bundle lookup doubles as the
+    # existence check and the templates only render the challenge id
+    key, key_parts = _challenge_bundle(challenge_id)
+    if key is None:
         flash("Challenge not found.", "error")
         return redirect(url_for('list_challenges'))
-    
-    key = get_challenge_key(challenge_id)
-    key_parts = key_reveal_manager.split_key(key)
+    challenge = {'id': challenge_id}
     
     scramble_part = next((p for p in key_parts if p['game_type'] == 'scramble'), None)
     if not scramble_part:
         flash("Scramble game not available.", "warning")
         return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
-    
-    progress = key_reveal_manager.get_user_progress(current_user.id, challenge_id)
-    if 'scramble' in progress and progress['scramble'].get('completed'):
-        flash(f"Already completed! Key part: {scramble_part['value']}", "success")
-        return redirect(url_for('minigames.minigames_hub', challenge_id=challenge_id))
+
     
     scramble_data = key_reveal_manager.generate_scramble()
-    session[f'scramble_{challenge_id}'] = {
+    state_token = _issue_state('scramble', challenge_id, {
         'word': scramble_data['word'],
         'key_part': scramble_part['value']
-    }
-    
+    })
+
     return render_template('minigames/scramble.html',
                          challenge=challenge,
                          scrambled=scramble_data['scrambled'],
-                         hint=scramble_data['hint'])
+                         hint=scramble_data['hint'],
+                         state_token=state_token)
 
 
 @minigames_bp.route('/challenge/<challenge_id>/scramble/submit', methods=['POST'])
 @login_required
 def scramble_submit(challenge_id):
     """Submit scramble answer."""
-    scramble_data = session.get(f'scramble_{challenge_id}')
+    body = request.get_json(silent=True) or {}
+    scramble_data = _load_state('scramble', challenge_id, body.get('token', ''))
     if not scramble_data:
-        return jsonify({'success': False, 'message': 'Invalid session'})
-    
-    answer = request.json.get('answer', '')
+        return jsonify({'success': False, 'message': 'Invalid or expired game token'})
+
+    answer = body.get('answer', '')
     if key_reveal_manager.verify_scramble(answer, scramble_data['word']):
         key_part = scramble_data['key_part']
         key_reveal_manager.mark_game_completed(
             current_user.id, challenge_id, 'scramble', key_part
         )
-        session.pop(f'scramble_{challenge_id}', None)
         return jsonify({
             'success': True,
             'revealed_part': key_part,
@@ -3,7 +3,7 @@ from flask_login import login_required, current_user
 from core.database import db_session
 from core.auth.models import User
 from core.marketplace.models import Seller, Buyer
-from werkzeug.security import generate_password_hash, check_password_hash
+from core.auth.passwords import hash_password, verify_password, CURRENT_SCHEME
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -33,15 +33,17 @@ def edit_profile():
         
         # Update password if provided
         if current_password and new_password:
-            if not check_password_hash(current_user.password_hash, current_password):
+            # verify_password handles both bcrypt and legacy werkzeug hashes
+            if not verify_password(current_user.username, current_password, current_user.password_hash):
                 flash('Current password is incorrect', 'error')
                 return render_template('profile/edit.html')
-            
+
             if new_password != confirm_password:
                 flash('New passwords do not match', 'error')
                 return render_template('profile/edit.html')
-            
-            current_user.password_hash = generate_password_hash(new_password)
+
+            current_user.password_hash = hash_password(new_password)
+            current_user.password_scheme = CURRENT_SCHEME
             flash('Password updated successfully', 'success')
         
         db_session.commit()